@@ -6,6 +6,10 @@ parent_dir = os.path.abspath(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
 )
 sys.path.append(parent_dir)
+import asyncio
+import json
+import multiprocessing
+import time
 from copy import deepcopy
 from typing import List, Union
 from geomotion import (
@@ -23,6 +27,19 @@ np.set_printoptions(precision=3, suppress=True)
 # Set the group as SE2 from rigidbody
 G = rb.SE2
 
+# Chain being swept by a worker process of DiffKinematicChain.manipulability_map. It is set once in each worker by
+# the pool initializer, instead of being sent along with every chunk, and is never set in the calling process
+_sweep_chain = None
+
+
+def _init_sweep_worker(chain):
+    global _sweep_chain
+    _sweep_chain = chain
+
+
+def _manipulability_chunk(chunk_args):
+    return _sweep_chain.manipulability_chunk(*chunk_args)
+
 
 class DiffKinematicChain(kc.KinematicChain):
 
@@ -55,10 +72,8 @@ class DiffKinematicChain(kc.KinematicChain):
         # end of the link, and using its Adjoint-inverse to transform the joint axis to the body frame of
         # the selected link, and then transform this velocity to the world, or spatial coordinates if requested
 
-        # Make a list named link_positions_with_base that is the same as self.link_positions, but additionally has an
-        # identity element inserted before the first entry
-        self.link_positions_with_base = [l for l in self.link_positions]
-        self.link_positions_with_base.insert(0, G.identity_element())
+        # self.link_positions_with_base is the same as self.link_positions, but additionally has an identity element
+        # inserted before the first entry. It is kept up to date by set_configuration, so it is not rebuilt here
         #! useful to get just once
         selected_link: rplg.RepresentationLieGroupElement = self.link_positions[
             link_index - 1
@@ -114,10 +129,8 @@ class DiffKinematicChain(kc.KinematicChain):
         # Populate the Jacobian matrix by finding the position of each joint in the world (which is the same as the
         # position of the previous link), and using its Adjoint to send the axis into spatial coordinates
 
-        # Make a list named link_positions_with_base that is the same as self.link_positions, but additionally has an
-        # identity element inserted before the first entry
-        self.link_positions_with_base = [l for l in self.link_positions]
-        self.link_positions_with_base.insert(0, G.identity_element())
+        # self.link_positions_with_base is the same as self.link_positions, but additionally has an identity element
+        # inserted before the first entry. It is kept up to date by set_configuration, so it is not rebuilt here
 
         selected_link: rplg.RepresentationLieGroupElement = self.link_positions[
             link_index - 1
@@ -155,6 +168,263 @@ class DiffKinematicChain(kc.KinematicChain):
 
         return J
 
+    def Jacobians(self, output_frame="body"):  # options are world, body, spatial
+        """Calculate the Jacobians of all the links at the current configuration, returned as an
+        (n_links, n_dim, n_joints) array whose ith entry is the Jacobian of link i+1"""
+
+        link_position_reps = np.array([l.rep for l in self.link_positions])
+
+        return self.Jacobians_from_reps(link_position_reps, output_frame)
+
+    def Jacobians_batch(self, joint_angle_array, output_frame="body"):  # options are world, body, spatial
+        """Calculate the Jacobians of all the links at each row of an (M, n_joints) array of joint angles, returned
+        as an (M, n_links, n_dim, n_joints) array"""
+
+        _, link_position_reps = self.set_configurations(joint_angle_array, output_reps=True)
+
+        return self.Jacobians_from_reps(link_position_reps, output_frame)
+
+    def Jacobians_from_reps(self, link_position_reps, output_frame="body"):
+        """Calculate the Jacobians of all the links from an (..., n_links, k, k) array of link position
+        representations. Each joint axis is mapped to the spatial frame once, with the Adjoint of the link position
+        preceding the joint, and the spatial Jacobian is then carried to each link's body or world frame"""
+
+        link_position_reps = np.asarray(link_position_reps, dtype=float)
+        n_links = link_position_reps.shape[-3]
+        n_joints = len(self.joint_axes)
+
+        # The spatial joint axes make up the columns of the spatial Jacobian of every link, up to the joints that
+        # precede it
+        J_spatial = np.swapaxes(self.spatial_joint_axes(link_position_reps), -1, -2)
+
+        # Joints after a link do not move it
+        joint_mask = np.arange(n_joints)[None, :] <= np.arange(n_links)[:, None]
+        J_spatial = J_spatial[..., None, :, :] * joint_mask[:, None, :]
+
+        return self.spatial_to_frame(link_position_reps, J_spatial, output_frame)
+
+    def link_velocities(self, joint_angle_array, joint_velocity_array, output_frame="body"):
+        """Calculate the velocities of all the links for each row of (M, n_joints) arrays of joint angles and joint
+        velocities, returned as an (M, n_links, n_dim) array. The spatial velocity of each link is found recursively
+        as the spatial velocity of the previous link plus the spatial joint axis scaled by the joint velocity, and is
+        then carried to the body or world frame of the link"""
+
+        joint_velocity_array = np.atleast_2d(np.asarray(joint_velocity_array, dtype=float))
+
+        _, link_position_reps = self.set_configurations(joint_angle_array, output_reps=True)
+        n_links = link_position_reps.shape[-3]
+
+        # Velocity contributed by each joint, and their running sum along the chain
+        joint_velocities = self.spatial_joint_axes(link_position_reps) * joint_velocity_array[..., None]
+        spatial_velocities = np.cumsum(joint_velocities, axis=-2)[..., :n_links, :]
+
+        return self.spatial_to_frame(link_position_reps, spatial_velocities[..., None], output_frame)[..., 0]
+
+    def spatial_joint_axes(self, link_position_reps):
+        """Use the Adjoint of each joint position to map its axis back to the identity of the group, returning an
+        (..., n_joints, n_dim) array of the joint axes in spatial coordinates"""
+
+        n_joints = len(self.joint_axes)
+
+        # Link positions with an identity element inserted before the first entry, so that entry j is the position
+        # of joint j
+        base_reps = np.broadcast_to(G.identity_rep, link_position_reps.shape[:-3] + (1,) + G.identity_rep.shape)
+        link_position_reps_with_base = np.concatenate([base_reps, link_position_reps], axis=-3)
+
+        axis_values = np.array([np.asarray(axis.value).flatten() for axis in self.joint_axes])
+        joint_Ad = G.Ad_matrix_grid(link_position_reps_with_base[..., :n_joints, :, :])
+
+        return np.matmul(joint_Ad, axis_values[:, :, None])[..., 0]
+
+    def spatial_to_frame(self, link_position_reps, spatial_values, output_frame="body"):
+        """Transfer spatial velocities (as the columns of an (..., n_links, n_dim, k) array) to the requested frame
+        at each link"""
+
+        if output_frame == "spatial":
+            return spatial_values
+        elif output_frame == "body":
+            return np.matmul(G.Ad_inv_matrix_grid(link_position_reps), spatial_values)
+        elif output_frame == "world":
+            return np.matmul(G.TR_matrix_grid(link_position_reps), spatial_values)
+        else:
+            raise ValueError(
+                f"Only body, spatial and world frame supported! you gave {output_frame}!"
+            )
+
+    def inverse_kinematics(
+        self,
+        target,  # Target position for the selected link, as a group element or an (M, n_dim) array of group values
+        initial_joint_angles=None,  # (n_joints,) or (M, n_joints) starting joint angles
+        link_index=None,  # Link number (with 1 as the first link), defaulting to the last link
+        joint_limits=None,  # Optional (n_joints, 2) array of lower and upper joint limits
+        damping=0.1,  # Initial damping factor for the damped least-squares steps
+        tolerance=1e-8,  # Error norm below which a solution counts as converged
+        max_iterations=100,
+        max_damping=1e6,  # Largest damping factor, at which a row that still cannot improve is given up on
+        step_tolerance=1e-12,  # Step norm below which a row that has not converged is given up on
+    ):
+        """Find joint angles that place the selected link at the target, by damped least squares with Levenberg-
+        Marquardt adjustment of the damping. The error at each step is the Lie algebra coordinates of the logarithm
+        of the relative transform from the link to the target, and it is reduced with the body Jacobian of the link.
+
+        Several problems are solved together: either the targets or the initial joint angles can have M rows (for
+        many-target or multi-start solves), with a single target or initial configuration shared across rows.
+        Returns the (M, n_joints) joint angles (wrapped into (-pi, pi]), the (M,) final error norms and an (M,) mask
+        of converged rows. Rows that stall (with the damping at max_damping, or steps shorter than step_tolerance)
+        stop early and are reported as not converged"""
+
+        if link_index is None:
+            link_index = len(self.links)
+
+        # Get the matrix representations of the targets
+        if isinstance(target, rplg.RepresentationLieGroupElement):
+            target_reps = target.rep[None]
+        else:
+            target_reps = G.representation_grid(np.atleast_2d(np.asarray(target, dtype=float)))
+
+        # Start from the current joint angles if no initial angles were given
+        if initial_joint_angles is None:
+            initial_joint_angles = self.joint_angles
+        joint_angle_array = np.atleast_2d(np.asarray(initial_joint_angles, dtype=float))
+
+        # Broadcast the targets and initial joint angles against each other
+        n_problems = max(len(target_reps), len(joint_angle_array))
+        target_reps = np.broadcast_to(target_reps, (n_problems,) + target_reps.shape[1:])
+        joint_angle_array = np.array(np.broadcast_to(joint_angle_array, (n_problems, joint_angle_array.shape[1])))
+
+        if joint_limits is not None:
+            joint_limits = np.asarray(joint_limits, dtype=float)
+            joint_angle_array = np.clip(joint_angle_array, joint_limits[:, 0], joint_limits[:, 1])
+
+        def pose_error(joint_angles, targets):
+            # Error as the Lie algebra coordinates of the transform from the selected link to the target
+            _, link_position_reps = self.set_configurations(joint_angles, output_reps=True)
+            link_reps = link_position_reps[:, link_index - 1]
+            error_reps = G.log_rep_grid(np.matmul(np.linalg.inv(link_reps), targets))
+            return G.Lie_alg_derep_grid(error_reps), link_position_reps
+
+        error, link_position_reps = pose_error(joint_angle_array, target_reps)
+        error_norm = np.linalg.norm(error, axis=-1)
+        damping_array = np.full(n_problems, float(damping))
+        stalled = np.zeros(n_problems, dtype=bool)
+
+        for _ in range(max_iterations):
+
+            active = (error_norm >= tolerance) & ~stalled
+            if not np.any(active):
+                break
+
+            # Damped least-squares step for the rows that have not yet converged
+            J = self.Jacobians_from_reps(link_position_reps[active], "body")[:, link_index - 1]
+            J_T = np.swapaxes(J, -1, -2)
+            damped_JJ_T = np.matmul(J, J_T) + (damping_array[active, None, None] ** 2) * np.eye(J.shape[-2])
+            step = np.matmul(J_T, np.linalg.solve(damped_JJ_T, error[active][:, :, None]))[..., 0]
+
+            trial_joint_angles = joint_angle_array[active] + step
+            if joint_limits is not None:
+                trial_joint_angles = np.clip(trial_joint_angles, joint_limits[:, 0], joint_limits[:, 1])
+
+            trial_error, trial_link_position_reps = pose_error(trial_joint_angles, target_reps[active])
+            trial_error_norm = np.linalg.norm(trial_error, axis=-1)
+
+            # Keep the steps that reduced the error and relax their damping, and increase the damping for the rest
+            improved = trial_error_norm < error_norm[active]
+            active_indices = np.flatnonzero(active)
+            accepted = active_indices[improved]
+            rejected = active_indices[~improved]
+
+            joint_angle_array[accepted] = trial_joint_angles[improved]
+            error[accepted] = trial_error[improved]
+            error_norm[accepted] = trial_error_norm[improved]
+            link_position_reps[accepted] = trial_link_position_reps[improved]
+            damping_array[accepted] = damping_array[accepted] * 0.5
+            damping_array[rejected] = np.minimum(damping_array[rejected] * 4, max_damping)
+
+            # Give up on rows that can no longer make progress
+            stalled[rejected] = damping_array[rejected] >= max_damping
+            stalled[active_indices[np.linalg.norm(step, axis=-1) < step_tolerance]] = True
+
+        converged = error_norm < tolerance
+
+        # Wrap the joint angles into (-pi, pi], keeping the unwrapped angles where wrapping would leave the limits
+        wrapped_joint_angles = np.pi - np.mod(np.pi - joint_angle_array, 2 * np.pi)
+        if joint_limits is not None:
+            within_limits = (wrapped_joint_angles >= joint_limits[:, 0]) & (wrapped_joint_angles <= joint_limits[:, 1])
+            wrapped_joint_angles = np.where(within_limits, wrapped_joint_angles, joint_angle_array)
+
+        return wrapped_joint_angles, error_norm, converged
+
+    def manipulability_chunk(self, joint_angle_array, link_index, output_frame="body"):
+        """Manipulability, condition number and velocity ellipse axes of the selected link's Jacobian at each row of
+        an (M, n_joints) array of joint angles. The ellipse axes are returned as an (M, n_dim, n_dim) array whose kth
+        column at each point is the kth singular direction scaled by its singular value"""
+
+        J = self.Jacobians_batch(joint_angle_array, output_frame)[:, link_index - 1]
+
+        U, sigma, _ = np.linalg.svd(J)
+
+        # Singular values for all n_dim output directions, with zeros for the directions a link with fewer joints
+        # than the group has dimensions cannot move in
+        n_dim = J.shape[-2]
+        sigma_full = np.zeros(J.shape[:1] + (n_dim,))
+        sigma_full[:, :sigma.shape[-1]] = sigma
+
+        # sqrt(det(J J^T)) is the product of the singular values
+        manipulability = np.prod(sigma_full, axis=-1)
+
+        # Singular configurations (including links that cannot move in every direction) have infinite condition number
+        with np.errstate(divide="ignore", invalid="ignore"):
+            condition_number = np.where(sigma_full[:, -1] > 0, sigma_full[:, 0] / sigma_full[:, -1], np.inf)
+
+        ellipse_axes = U * sigma_full[:, None, :]
+
+        return manipulability, condition_number, ellipse_axes
+
+    def manipulability_map(
+        self,
+        joint_grid,  # Grid of joint angles in component format, e.g., from ut.meshgrid_array
+        link_index=None,  # Link number (with 1 as the first link), defaulting to the last link
+        output_frame="body",  # options are world, body, spatial
+        chunk_size=10000,  # Number of configurations evaluated together
+        n_processes=None,  # Number of worker processes to split the chunks over, if more than one
+    ):
+        """Evaluate the manipulability, condition number and velocity ellipse axes of a link over a grid of joint
+        configurations. The grid is processed in chunks of configurations with the batched Jacobian, optionally
+        spread over several worker processes (started with the platform's default method, so the chain is pickled
+        to each worker once). Returns the manipulability and condition number as GridArrays
+        with the shape of the joint grid, and the ellipse axes as a GridArray in component format, whose [:, k]
+        entry is the kth axis"""
+
+        if link_index is None:
+            link_index = len(self.links)
+
+        joint_grid = np.asarray(joint_grid, dtype=float)
+        grid_shape = joint_grid.shape[1:]
+
+        # List the configurations as rows and split them into chunks
+        joint_angle_array = np.reshape(joint_grid, (joint_grid.shape[0], -1)).T
+        chunks = [(joint_angle_array[i:i + chunk_size], link_index, output_frame)
+                  for i in range(0, len(joint_angle_array), chunk_size)]
+
+        if (n_processes is not None) and (n_processes > 1):
+            with multiprocessing.Pool(n_processes, initializer=_init_sweep_worker, initargs=(self,)) as pool:
+                chunk_results = pool.map(_manipulability_chunk, chunks)
+        else:
+            chunk_results = [self.manipulability_chunk(*chunk) for chunk in chunks]
+
+        manipulability = np.concatenate([r[0] for r in chunk_results])
+        condition_number = np.concatenate([r[1] for r in chunk_results])
+        ellipse_axes = np.concatenate([r[2] for r in chunk_results])
+
+        # Put the results back on the joint grid
+        manipulability = ut.GridArray(np.reshape(manipulability, grid_shape), n_outer=0)
+        condition_number = ut.GridArray(np.reshape(condition_number, grid_shape), n_outer=0)
+        ellipse_axes = ut.GridArray(np.moveaxis(np.reshape(ellipse_axes, grid_shape + ellipse_axes.shape[1:]),
+                                                [-2, -1], [0, 1]),
+                                    n_outer=2)
+
+        return manipulability, condition_number, ellipse_axes
+
     def draw_Jacobian(self, ax: plt.Axes):
         """Draw the components of the last-requested Jacobian"""
 
@@ -207,6 +477,319 @@ class DiffKinematicChain(kc.KinematicChain):
         ax.set_aspect('equal', adjustable='datalim')
 
 
+class KinematicChainServer:
+    """Local service that answers forward kinematics and Jacobian requests for a kinematic chain over a Unix socket.
+    Requests that arrive within a short latency window of each other are gathered into a micro-batch and evaluated
+    together with the chain's batched methods.
+
+    Messages are single lines of JSON. A request has the form
+        {"id": ..., "type": "fk" or "jacobians", "joint_angles": [...], "output_frame": "body"}
+    and is answered with {"id": ..., "result": [...]} or {"id": ..., "error": "..."}"""
+
+    request_types = ("fk", "jacobians")
+    output_frames = ("body", "spatial", "world")
+
+    def __init__(
+        self,
+        chain: DiffKinematicChain,
+        socket_path,
+        batch_window=0.002,  # Time in seconds to wait for more requests after the first request of a batch
+        max_batch_size=4096,  # Largest number of requests to evaluate together
+    ):
+        self.chain = chain
+        self.socket_path = socket_path
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+
+        self.queue = None
+        self.server = None
+        self.batch_task = None
+        self.writers = set()
+
+        # Throughput and latency counters
+        self.n_requests = 0
+        self.n_batches = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.start_time = None
+
+    async def start(self):
+        """Start listening on the socket and processing batches"""
+
+        self.queue = asyncio.Queue()
+        self.start_time = time.perf_counter()
+        self.batch_task = asyncio.create_task(self.process_batches())
+        self.server = await asyncio.start_unix_server(self.handle_connection, path=self.socket_path)
+
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        await self.server.serve_forever()
+
+    async def close(self):
+        """Stop listening and stop processing batches"""
+
+        # Stop accepting connections before winding down the ones that are open
+        if self.server is not None:
+            self.server.close()
+
+        # Stop processing batches (answering the requests of an interrupted batch), answer the requests that will no
+        # longer be evaluated, and close the open connections so that clients see the end of the stream. This has
+        # to happen before waiting for the server to close, which also waits for the open connections to finish
+        if self.batch_task is not None:
+            self.batch_task.cancel()
+            try:
+                await self.batch_task
+            except asyncio.CancelledError:
+                pass
+        while self.queue is not None and not self.queue.empty():
+            request, future, _ = self.queue.get_nowait()
+            if not future.done():
+                future.set_result({"id": request.get("id"), "error": "Server closed"})
+        for writer in list(self.writers):
+            writer.close()
+
+        if self.server is not None:
+            await self.server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    async def handle_connection(self, reader, writer):
+        """Queue each request from a client, and write back the responses as they are resolved. Responses on a
+        connection can come back in a different order than the requests, and are matched by their ids"""
+
+        response_tasks = set()
+        self.writers.add(writer)
+
+        async def respond(request):
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((request, future, time.perf_counter()))
+            response = await future
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                # Answer a malformed line with an error and keep serving the connection
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request must be a JSON object")
+                except ValueError as error:
+                    writer.write((json.dumps({"id": None, "error": f"Malformed request: {error}"}) + "\n").encode())
+                    await writer.drain()
+                    continue
+
+                task = asyncio.create_task(respond(request))
+                response_tasks.add(task)
+                task.add_done_callback(response_tasks.discard)
+        finally:
+            # Finish replying to the requests already received before closing the connection
+            if response_tasks:
+                await asyncio.gather(*response_tasks, return_exceptions=True)
+            self.writers.discard(writer)
+            writer.close()
+
+    async def process_batches(self):
+        """Gather queued requests into micro-batches and evaluate them"""
+
+        batch = []
+        try:
+            while True:
+                # Wait for the first request of a batch, and then for more requests until the window closes or the
+                # batch is full
+                batch = [await self.queue.get()]
+                deadline = time.perf_counter() + self.batch_window
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                # Evaluate the batch in a worker thread so that the event loop keeps reading and writing while it
+                # computes, then resolve the futures back on the event loop. A failure of the evaluation as a whole
+                # fails only this batch, and the server carries on with the next one
+                requests = [request for request, _, _ in batch]
+                try:
+                    responses = await asyncio.get_running_loop().run_in_executor(None, self.evaluate_batch, requests)
+                except Exception as error:
+                    responses = [{"id": request.get("id"), "error": f"Evaluation failed: {error}"}
+                                 for request in requests]
+
+                for (_, future, _), response in zip(batch, responses):
+                    if not future.done():
+                        future.set_result(response)
+
+                self.update_stats(batch)
+        finally:
+            # Answer the requests of a batch that was interrupted before it was evaluated
+            for request, future, _ in batch:
+                if not future.done():
+                    future.set_result({"id": request.get("id"), "error": "Server closed"})
+
+    def evaluate_batch(self, requests):
+        """Evaluate a batch of requests, grouping them by request type and output frame, and return the responses
+        in the order of the requests. Requests with an unknown type or output frame, or whose joint angles do not
+        match the chain, are answered with an error and left out of the batch"""
+
+        n_joints = len(self.chain.joint_axes)
+        responses = [None] * len(requests)
+
+        groups = {}
+        for i, request in enumerate(requests):
+            try:
+                request_type = request.get("type", "fk")
+                if not (isinstance(request_type, str) and request_type in self.request_types):
+                    raise ValueError(f"Unknown request type {request_type!r}")
+                output_frame = request.get("output_frame", "body")
+                if not (isinstance(output_frame, str) and output_frame in self.output_frames):
+                    raise ValueError(f"Unknown output frame {output_frame!r}")
+                joint_angles = np.asarray(request.get("joint_angles"), dtype=float)
+                if joint_angles.shape != (n_joints,):
+                    raise ValueError(f"Expected {n_joints} joint angles, got shape {joint_angles.shape}")
+            except (TypeError, ValueError) as error:
+                responses[i] = {"id": request.get("id"), "error": str(error)}
+                continue
+            groups.setdefault((request_type, output_frame), []).append((i, joint_angles))
+
+        for (request_type, output_frame), group in groups.items():
+            indices = [i for i, _ in group]
+            try:
+                joint_angle_array = np.array([joint_angles for _, joint_angles in group])
+                if request_type == "fk":
+                    results = self.chain.set_configurations(joint_angle_array)
+                else:
+                    results = self.chain.Jacobians_batch(joint_angle_array, output_frame)
+                for i, result in zip(indices, results):
+                    responses[i] = {"id": requests[i].get("id"), "result": result.tolist()}
+            except Exception as error:
+                for i in indices:
+                    responses[i] = {"id": requests[i].get("id"), "error": str(error)}
+
+        return responses
+
+    def update_stats(self, batch):
+        """Update the throughput and latency counters with a batch that has been answered"""
+
+        now = time.perf_counter()
+        latencies = [now - arrival_time for _, _, arrival_time in batch]
+        self.n_requests += len(batch)
+        self.n_batches += 1
+        self.total_latency += sum(latencies)
+        self.max_latency = max(self.max_latency, max(latencies))
+
+    @property
+    def stats(self):
+        """Throughput and latency counters for the requests served so far"""
+
+        elapsed = time.perf_counter() - self.start_time if self.start_time is not None else 0.0
+
+        return {"n_requests": self.n_requests,
+                "n_batches": self.n_batches,
+                "mean_batch_size": self.n_requests / self.n_batches if self.n_batches else 0.0,
+                "mean_latency": self.total_latency / self.n_requests if self.n_requests else 0.0,
+                "max_latency": self.max_latency,
+                "throughput": self.n_requests / elapsed if elapsed > 0 else 0.0}
+
+
+class KinematicChainClient:
+    """Client for a KinematicChainServer. Many requests can be in flight at once on a single connection"""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        self.pending = {}
+        self.next_id = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        self.read_task = asyncio.create_task(self.read_responses())
+
+        return self
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self.read_task is not None:
+            self.read_task.cancel()
+            try:
+                await self.read_task
+            except asyncio.CancelledError:
+                pass
+
+    async def read_responses(self):
+        """Hand each response to the request waiting for it"""
+
+        error = ConnectionError("Connection to the kinematic chain server closed")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (ConnectionError, ValueError) as read_error:
+            error = ConnectionError(f"Lost connection to the kinematic chain server: {read_error}")
+        finally:
+            # Fail the requests still waiting for a response, so that their callers do not wait forever
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    async def request(self, request_type, joint_angles, output_frame="body"):
+        if self.read_task is None or self.read_task.done():
+            raise ConnectionError("Not connected to a kinematic chain server")
+
+        request_id = self.next_id
+        self.next_id += 1
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+
+        request = {"id": request_id,
+                   "type": request_type,
+                   "joint_angles": np.asarray(joint_angles, dtype=float).tolist(),
+                   "output_frame": output_frame}
+        try:
+            self.writer.write((json.dumps(request) + "\n").encode())
+            await self.writer.drain()
+        except ConnectionError:
+            self.pending.pop(request_id, None)
+            raise
+
+        response = await future
+        if "error" in response:
+            raise Exception(response["error"])
+
+        return np.array(response["result"])
+
+    async def forward_kinematics(self, joint_angles):
+        """Link positions of the chain at a set of joint angles, as an (n_links, n_dim) array"""
+        return await self.request("fk", joint_angles)
+
+    async def Jacobians(self, joint_angles, output_frame="body"):
+        """Jacobians of all the links of the chain at a set of joint angles, as an (n_links, n_dim, n_joints) array"""
+        return await self.request("jacobians", joint_angles, output_frame)
+
+
 if __name__ == "__main__":
     # Create a list of three links, all extending in the x direction with different lengths
     links = [G.element([3, 0, 0]), G.element([2, 0, 0]), G.element([1, 0, 0])]
@@ -7,6 +7,8 @@ parent_dir = os.path.abspath(
 sys.path.append(parent_dir)
 from geomotion import rigidbody as rb
 from geomotion import representationliegroup as rplg
+from geomotion import utilityfunctions as ut
+from geomotion import plottingfunctions as gplt
 import numpy as np
 from matplotlib import pyplot as plt
 from typing import List
@@ -40,44 +42,184 @@ class KinematicChain:
         # These transforms should be initialized as group identity elements
         self.link_positions: List[rplg.RepresentationLieGroupElement] = [G.identity_element()] * (len(links))
 
+        # Keep a list of the link positions with an identity element inserted before the first entry (i.e., the
+        # positions of the joints), which is updated along with self.link_positions
+        self.link_positions_with_base: List[rplg.RepresentationLieGroupElement] = \
+            [G.identity_element()] + self.link_positions
+
+        # Track which joint transforms are out of date with the joint angles. Everything starts out stale, so that
+        # the first configuration computes the whole chain
+        self.stale_joints: np.ndarray = np.ones(len(joint_axes), dtype=bool)
+
         return
 
     def set_configuration(self,
                           joint_angles):
 
         """Multiply the joint angles by the corresponding joint axes and exponentiate them, storing the resulting
-        group elements as a list called 'joint_transforms' that is both saved as an attribute and returned by
-        the function"""
+        group elements as a list called 'joint_transforms', and take the cumulative product of the joint transforms
+        and links to find the link positions, which are saved as an attribute and returned by the function. Only the
+        joints whose angles have changed are re-exponentiated, and only the links after the first changed joint are
+        recomputed"""
+
+        joint_angles = np.array(joint_angles, dtype=float)
 
-        # Save the provided joint angles to self.joint_angles
+        # Mark the joints whose angles have changed, and save the provided joint angles to self.joint_angles
+        self.stale_joints = self.stale_joints | (joint_angles != self.joint_angles)
         self.joint_angles = joint_angles
 
-        # Set up a loop over the elements of self.joint_axes
-        for i, alpha in enumerate(joint_angles):
+        return self.update_configuration()
+
+    def set_joint(self,
+                  joint_index,  # Joint number (with 0 as the first joint, matching self.joint_angles)
+                  joint_angle):
+
+        """Change a single joint angle, recomputing only the parts of the chain that it affects"""
+
+        return self.set_joints([joint_index], [joint_angle])
+
+    def set_joints(self,
+                   joint_indices,  # Joint numbers (with 0 as the first joint, matching self.joint_angles)
+                   joint_angles):
+
+        """Change a subset of the joint angles, recomputing only the parts of the chain that they affect"""
+
+        new_joint_angles = np.array(self.joint_angles, dtype=float)
+        new_joint_angles[joint_indices] = joint_angles
 
-            # Multiply the ith joint angle by the ith joint axis
-            scaled_axis: rplg.RepresentationLieGroupTangentVector = alpha * self.joint_axes[i]
+        return self.set_configuration(new_joint_angles)
 
-            # Exponentiate the scaled axis (it's in the Lie algebra, so either exp_L or exp_R will work) and save it to
-            # the ith element of self.joint_transforms
+    def update_configuration(self):
+
+        """Bring the joint transforms and link positions up to date with the joint angles"""
+
+        stale_indices = np.flatnonzero(self.stale_joints)
+
+        # If nothing has changed, the cached link positions are still valid
+        if stale_indices.size == 0:
+            return self.link_positions
+
+        # Exponentiate the scaled joint axes of the joints that have changed (the axes are in the Lie algebra, so
+        # either exp_L or exp_R will work)
+        for i in stale_indices:
+            scaled_axis: rplg.RepresentationLieGroupTangentVector = float(self.joint_angles[i]) * self.joint_axes[i]
             self.joint_transforms[i] = scaled_axis.exp_L
 
+        self.stale_joints = np.zeros(len(self.joint_axes), dtype=bool)
+
         ########
-        # Take the cumulative product of the joint transforms and link elements, saving the end point of each link to
-        # self.link_positions
+        # Take the cumulative product of the joint transforms and link elements, starting from the first changed
+        # joint and saving the end point of each link to self.link_positions
+        first_changed = stale_indices[0]
 
-        # Save the product of the first joint transform and link to the first element of self.link_positions
-        self.link_positions[0] = self.joint_transforms[0] * self.links[0]
+        for i in range(first_changed, len(self.link_positions)):
 
-        # Set up a loop over the elements of self.link_positions, starting with the second position
-        for i in range(1, len(self.link_positions)):
+            # The first link position is the product of the first joint transform and link. Each later link
+            # position is the product of the previous link position, the ith joint transform, and the ith link
+            if i == 0:
+                self.link_positions[i] = self.joint_transforms[i] * self.links[i]
+            else:
+                self.link_positions[i] = self.link_positions[i - 1] * self.joint_transforms[i] * self.links[i]
 
-            # Set the ith element of self.link_positions to be the product of the (i-1)th element, the ith
-            # joint transform, and the ith link transform
-            self.link_positions[i] = self.link_positions[i - 1] * self.joint_transforms[i] * self.links[i]
+            self.link_positions_with_base[i + 1] = self.link_positions[i]
 
         return self.link_positions
 
+    def set_configurations(self,
+                           joint_angle_array,
+                           output_reps=False):
+
+        """Evaluate the chain at many sets of joint angles at once. joint_angle_array is an (M, n_joints) array with
+        one set of joint angles per row. The link positions are returned as an (M, n_links, n_dim) array of group
+        values, and, if output_reps is True, also as an (M, n_links, k, k) array of matrix representations. Instead
+        of building element objects, the joint exponentials and link products are evaluated on arrays of matrices"""
+
+        # Make sure the joint angles are a two-dimensional array, with one configuration per row
+        joint_angle_array = np.atleast_2d(np.asarray(joint_angle_array, dtype=float))
+
+        # Get the matrix representations of the joint axes (in the Lie algebra) and of the links
+        axis_reps = np.array([axis.left.rep for axis in self.joint_axes])
+        link_reps = np.array([link.rep for link in self.links])
+
+        # Exponentiate all of the scaled joint axes together. joint_reps has shape (M, n_joints, k, k)
+        joint_reps = G.exp_rep_grid(joint_angle_array[..., None, None] * axis_reps)
+
+        # Take the cumulative product of the joint transforms and link elements, one link at a time over all
+        # the configurations
+        link_position_reps = np.empty(joint_reps.shape[:1] + (len(self.links),) + link_reps.shape[1:])
+        link_position_reps[:, 0] = np.matmul(joint_reps[:, 0], link_reps[0])
+        for i in range(1, len(self.links)):
+            link_position_reps[:, i] = np.matmul(np.matmul(link_position_reps[:, i - 1], joint_reps[:, i]),
+                                                 link_reps[i])
+
+        # Convert the matrices back into group values
+        link_position_values = G.derepresentation_grid(link_position_reps)
+
+        if output_reps:
+            return link_position_values, link_position_reps
+        else:
+            return link_position_values
+
+    def workspace_samples(self,
+                          n_samples=None,  # Number of random samples to draw
+                          lattice_shape=None,  # Number of lattice points per joint, to sample on a lattice instead
+                          joint_limits=None,  # (n_joints, 2) array of joint limits, defaulting to [-pi, pi]
+                          chunk_size=10000,  # Number of samples evaluated together
+                          rng=None):  # Random number generator (or seed) for the random samples
+
+        """Generator that samples the joint space, either at random or on a lattice, and yields the samples in chunks
+        of at most chunk_size configurations. Each chunk is a tuple of an (m, n_joints) array of joint angles and the
+        (m, n_links, n_dim) array of link positions found from them by set_configurations, so that memory use is
+        bounded by the chunk size rather than the number of samples"""
+
+        n_joints = len(self.joint_axes)
+
+        if joint_limits is None:
+            joint_limits = np.tile([-np.pi, np.pi], (n_joints, 1))
+        joint_limits = np.asarray(joint_limits, dtype=float)
+
+        if lattice_shape is not None:
+
+            # Walk through the lattice in blocks of flat indices, only building the joint angles for each block
+            lattice_shape = tuple(np.broadcast_to(lattice_shape, (n_joints,)))
+            lattice_values = [np.linspace(joint_limits[j, 0], joint_limits[j, 1], lattice_shape[j])
+                              for j in range(n_joints)]
+            n_lattice = int(np.prod(lattice_shape))
+
+            for start in range(0, n_lattice, chunk_size):
+                lattice_indices = np.unravel_index(np.arange(start, min(start + chunk_size, n_lattice)), lattice_shape)
+                joint_angle_chunk = np.stack([lattice_values[j][lattice_indices[j]] for j in range(n_joints)], -1)
+
+                yield joint_angle_chunk, self.set_configurations(joint_angle_chunk)
+
+        else:
+
+            if n_samples is None:
+                raise Exception("Either n_samples or lattice_shape must be provided to sample the workspace")
+
+            rng = np.random.default_rng(rng)
+
+            for start in range(0, n_samples, chunk_size):
+                m = min(chunk_size, n_samples - start)
+                joint_angle_chunk = rng.uniform(joint_limits[:, 0], joint_limits[:, 1], (m, n_joints))
+
+                yield joint_angle_chunk, self.set_configurations(joint_angle_chunk)
+
+    def reduce_workspace(self,
+                         reducers,  # List of workspace reducers (e.g., OccupancyHistogram, BoundingBox, ReachRadius)
+                         **sample_kwargs):  # Arguments passed to workspace_samples
+
+        """Stream workspace samples through a set of reducers, returning the reducers once all the chunks have
+        been added to them"""
+
+        reducers = ut.ensure_list(reducers)
+
+        for joint_angle_chunk, link_position_chunk in self.workspace_samples(**sample_kwargs):
+            for reducer in reducers:
+                reducer.update(joint_angle_chunk, link_position_chunk)
+
+        return reducers
+
     def draw(self,
              ax):
         """ Draw the arm at its current set of joint angles, with its basepoint at the origin"""
@@ -110,6 +252,123 @@ class KinematicChain:
         return
 
 
+    def animate(self,
+                ax,
+                joint_angle_trajectory,  # (n_frames, n_joints) array of joint angles
+                interval=50,  # Time between frames in milliseconds
+                filename=None,  # If given, the animation is rendered to this file
+                fps=None,
+                blit=True):
+        """Animate the arm moving through a trajectory of joint angles. The link positions for all of the frames are
+        found together with set_configurations, and a single line artist has its data replaced at each frame"""
+
+        link_positions = self.set_configurations(joint_angle_trajectory)
+
+        # x and y values of the link endpoints at each frame, with the basepoint at the origin
+        x = np.concatenate([np.zeros((len(link_positions), 1)), link_positions[:, :, 0]], 1)
+        y = np.concatenate([np.zeros((len(link_positions), 1)), link_positions[:, :, 1]], 1)
+
+        line, = ax.plot(x[0], y[0], color='black')
+        ax.set_aspect('equal')
+
+        # Fit the axis to the whole trajectory, since the limits are not updated while blitting
+        ax.update_datalim(np.stack([x.ravel(), y.ravel()], 1))
+        ax.autoscale_view()
+
+        def update(frame):
+            line.set_data(x[frame], y[frame])
+            return [line]
+
+        return gplt.animate_frames(ax.figure, update, len(link_positions), interval, filename, fps, blit)
+
+
+class OccupancyHistogram:
+    """Streaming occupancy count of the positions reached by a link, over bins in x, y and theta"""
+
+    def __init__(self,
+                 xy_range,  # ((x_min, x_max), (y_min, y_max)) extent of the histogram
+                 bins=(50, 50, 16),  # Number of bins in x, y and theta
+                 link_index=-1):  # Link number (with 1 as the first link), defaulting to the last link
+
+        self.link_index = link_index
+        self.edges = [np.linspace(xy_range[0][0], xy_range[0][1], bins[0] + 1),
+                      np.linspace(xy_range[1][0], xy_range[1][1], bins[1] + 1),
+                      np.linspace(-np.pi, np.pi, bins[2] + 1)]
+
+        # Counts of the samples in each bin, and of the samples that fell outside the histogram
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.n_outside = 0
+
+    def update(self, joint_angle_chunk, link_position_chunk):
+        positions = link_position_chunk[:, link_index_to_position(self.link_index, link_position_chunk.shape[1])]
+        chunk_counts, _ = np.histogramdd(positions, bins=self.edges)
+
+        self.counts += chunk_counts.astype(np.int64)
+        self.n_outside += len(positions) - int(chunk_counts.sum())
+
+    @property
+    def occupied(self):
+        """Mask of the bins that were reached by at least one sample"""
+        return self.counts > 0
+
+
+class BoundingBox:
+    """Streaming bounds on the x, y and theta values reached by a link"""
+
+    def __init__(self,
+                 link_index=-1):  # Link number (with 1 as the first link), defaulting to the last link
+
+        self.link_index = link_index
+        self.lower = None
+        self.upper = None
+
+    def update(self, joint_angle_chunk, link_position_chunk):
+        positions = link_position_chunk[:, link_index_to_position(self.link_index, link_position_chunk.shape[1])]
+
+        if self.lower is None:
+            self.lower = np.min(positions, axis=0)
+            self.upper = np.max(positions, axis=0)
+        else:
+            self.lower = np.minimum(self.lower, np.min(positions, axis=0))
+            self.upper = np.maximum(self.upper, np.max(positions, axis=0))
+
+
+class ReachRadius:
+    """Streaming minimum and maximum distance of a link from the base of the chain, with the joint angles at which
+    the maximum was reached"""
+
+    def __init__(self,
+                 link_index=-1):  # Link number (with 1 as the first link), defaulting to the last link
+
+        self.link_index = link_index
+        self.min_radius = np.inf
+        self.max_radius = 0.0
+        self.max_joint_angles = None
+
+    def update(self, joint_angle_chunk, link_position_chunk):
+        positions = link_position_chunk[:, link_index_to_position(self.link_index, link_position_chunk.shape[1])]
+        radii = np.linalg.norm(positions[:, :2], axis=-1)
+
+        self.min_radius = min(self.min_radius, float(np.min(radii)))
+
+        i_max = np.argmax(radii)
+        if radii[i_max] > self.max_radius:
+            self.max_radius = float(radii[i_max])
+            self.max_joint_angles = joint_angle_chunk[i_max]
+
+
+def link_index_to_position(link_index, n_links):
+    """Convert a link number (with 1 as the first link, or negative numbers counting back from -1 for the last link)
+    into an array position, raising an IndexError for link numbers that do not refer to one of the n_links links"""
+    if 1 <= link_index <= n_links:
+        return link_index - 1
+    elif -n_links <= link_index <= -1:
+        return link_index
+    else:
+        raise IndexError("Link number " + str(link_index) + " is out of range for a chain with " + str(n_links)
+                         + " links (link numbers start at 1)")
+
+
 if __name__ == "__main__":
     # Create a list of three links, all extending in the x direction with different lengths
     links = [G.element([3, 0, 0]), G.element([2, 0, 0]), G.element([1, 0, 0])]
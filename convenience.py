@@ -63,4 +63,8 @@ class OpGen(object):
             self.params = params
             self.operation = lambda x, y: x @ y
             self.identity = np.array([0., 1.], [1., 0.])
-            self.inverse = lambda x: np.inv(x)
\ No newline at end of file
+            self.inverse = lambda x: np.inv(x)
+
+def config_key(coords, decimals=12):
+    """ Hashable key for a configuration, rounded so that round-off (e.g. g @ g^-1 vs the identity) shares a key """
+    return (np.round(np.asarray(coords, dtype=float).flatten(), decimals) + 0.).tobytes()
@@ -1,14 +1,112 @@
 from geomotion import (utilityfunctions as ut,
                        diffmanifold as tb,
-                       representationliegroup as rlgp,
                        rigidbody as rb,
                        plottingfunctions as gplt)
 import numpy as np
+import multiprocessing
 
 spot_color = gplt.crimson
 
 G = rb.SE2
 
+# Body being swept by a worker process of ContinuumBody.backbone_sweep. It is set once in each worker by the pool
+# initializer, instead of being sent along with every chunk, and is never set in the calling process
+_sweep_body = None
+
+
+def _init_sweep_worker(body):
+    global _sweep_body
+    _sweep_body = body
+
+
+def _backbone_sweep_chunk(chunk_args):
+    return _sweep_body.backbone_sweep_chunk(*chunk_args)
+
+
+
+def lie_alg_coordinates(h_circ):
+    """Coordinates of a Lie algebra element given either as a tangent vector or directly as coordinates"""
+    if isinstance(h_circ, tb.TangentVector):
+        return ut.ensure_ndarray(h_circ.value)
+    else:
+        return ut.ensure_ndarray(h_circ)
+
+
+def magnus_step(A1,
+                A2,
+                h):
+    """Fourth-order Magnus element for a step of length h of g' = g xi(s), from the velocity representations A1 and
+    A2 at the two Gauss points of the step. The commutator is [A1, A2] rather than [A2, A1] because the velocity
+    multiplies the pose from the right"""
+
+    commutator = np.matmul(A1, A2) - np.matmul(A2, A1)
+
+    return (h / 2) * (A1 + A2) + (np.sqrt(3) * h ** 2 / 12) * commutator
+
+
+def dexp_series(ad_matrices,
+                order=12):
+    """Sum of the series dexp = I + ad/2! + ad^2/3! + ... over an array of ad matrices (on the last two axes)"""
+
+    identity = np.eye(ad_matrices.shape[-1])
+
+    # Horner form, I + (ad/2)(I + (ad/3)(I + ...))
+    D = identity
+    for k in range(order, 0, -1):
+        D = identity + np.matmul(ad_matrices, D) / (k + 1)
+
+    return D
+
+
+class BackboneSolution:
+    """Poses along an integrated backbone. The poses are stored at the integration nodes, along with the Lie
+    algebra element of each step, so that poses between the nodes can be found by partial steps"""
+
+    def __init__(self,
+                 s_nodes,
+                 pose_reps,
+                 step_Omega):
+        self.s_nodes = s_nodes
+        self.pose_reps = pose_reps
+        self.step_Omega = step_Omega
+
+        # Mirror the layout of an ODE solution, with arclength as the independent variable and the poses as the
+        # component-format state
+        self.t = s_nodes
+        self.y = G.derepresentation_grid(pose_reps).T
+
+    def reps(self,
+             s):
+        """Matrix representations of the poses at an array of arclength values"""
+
+        s = np.clip(np.asarray(s, dtype=float), self.s_nodes[0], self.s_nodes[-1])
+
+        # Find the step containing each arclength value, and the fraction of that step needed to reach it
+        i = np.clip(np.searchsorted(self.s_nodes, s, side='right') - 1, 0, len(self.s_nodes) - 2)
+        fraction = (s - self.s_nodes[i]) / (self.s_nodes[i + 1] - self.s_nodes[i])
+
+        return np.matmul(self.pose_reps[i], G.exp_rep_grid(fraction[..., None, None] * self.step_Omega[i]))
+
+    def poses(self,
+              s,
+              output_reps=False):
+        """Poses at an array of arclength values, as an array whose last axis holds the group values"""
+
+        pose_reps = self.reps(s)
+        pose_values = G.derepresentation_grid(pose_reps)
+
+        if output_reps:
+            return pose_values, pose_reps
+        else:
+            return pose_values
+
+    def sol(self,
+            s):
+        """Poses at an array of arclength values, in component format (matching the dense output of an ODE
+        solution)"""
+
+        return np.moveaxis(self.poses(s), -1, 0)
+
 
 class ContinuumBody(rb.RigidBody):
 
@@ -38,35 +136,305 @@ class ContinuumBody(rb.RigidBody):
         # Save default width
         self.width = 0.03
 
+        # Number of integration steps along the backbone, and whether the shape description function can be
+        # called with an array of s values (returning an array whose last axis holds the Lie algebra coordinates)
+        self.n_steps = 100
+        self.vectorized_shape = False
+
+        # Default number of points along each side of the drawn outline and of spots along the backbone, and a
+        # cache of backbone samples for drawing
+        self.outline_resolution = 100
+        self.spot_resolution = 10
+        self.backbone_sample_cache = {}
+
+        # Matrix representations of the Lie algebra basis directions, used to assemble the backbone curvature
+        self.Lie_alg_basis_reps = G.Lie_alg_basis_reps()
+
     def set_configuration(self,
                           shape_parameters,
                           t=0):
-        def backbone_flow_function(g_value, s):
-            g = G.element(g_value)
-            h_circ_f = G.Lie_alg_vector([1, 0, 0])
-            h_circ_a = self.shape_description_function(shape_parameters, s, t)
 
-            return (g * (h_circ_f + h_circ_a)).value
+        self.shape_locus = self.integrate_backbone(shape_parameters, t)
+        self.backbone_sample_cache = {}
+
+    def backbone_velocity(self,
+                          shape_parameters,
+                          s,  # Array of arclength values
+                          t=0):
+        """Body velocity of the backbone with respect to arclength (the forward direction plus the shape
+        description) at an array of s values, returned as an (len(s), n_dim) array of Lie algebra coordinates"""
+
+        s = np.asarray(s, dtype=float)
+        h_circ_f = np.array([1, 0, 0])
+
+        if self.vectorized_shape:
+            h_circ_a = np.asarray(self.shape_description_function(shape_parameters, s, t), dtype=float)
+            h_circ_a = np.broadcast_to(h_circ_a, s.shape + h_circ_f.shape)
+        else:
+            h_circ_a = np.array([lie_alg_coordinates(self.shape_description_function(shape_parameters, s_i, t))
+                                 for s_i in s])
+
+        return h_circ_f + h_circ_a
+
+    def integrate_backbone(self,
+                           shape_parameters,
+                           t=0,
+                           s_values=None,  # Arclength values to include as integration nodes
+                           n_steps=None):
+        """Integrate the backbone g' = g xi(s) from the identity along the s span, using fourth-order Magnus steps:
+        over each step the body velocity is sampled at the two Gauss points and combined (with their commutator)
+        into a single Lie algebra element, whose exponential advances the pose. All the step exponentials are
+        taken together on arrays of matrices, and the poses are their cumulative product"""
+
+        s_nodes, pose_reps, Omega = self.integrate_backbones([shape_parameters], t, s_values, n_steps)
+
+        return BackboneSolution(s_nodes, pose_reps[0], Omega[0])
+
+    def integrate_backbones(self,
+                            shape_parameter_list,  # Sequence of M sets of shape parameters
+                            t=0,  # Time for all the shapes, or an array of M times
+                            s_values=None,  # Arclength values to include as integration nodes
+                            n_steps=None):
+        """Integrate the backbones of several shapes in lockstep on a shared set of nodes, returning the nodes, an
+        (M, n_nodes, 3, 3) array of pose representations and the (M, n_nodes - 1, 3, 3) array of step elements"""
+
+        n_shapes = len(shape_parameter_list)
+        t_array = np.broadcast_to(np.asarray(t, dtype=float), (n_shapes,))
+
+        s_nodes, h, s_gauss = self.integration_nodes(s_values, n_steps)
+
+        # Sample the body velocity of each shape at the Gauss points of each step
+        xi_reps = self.velocity_reps([self.backbone_velocity(shape_parameter_list[m], s_gauss.ravel(), t_array[m])
+                                      for m in range(n_shapes)],
+                                     s_gauss.shape)
+
+        Omega = magnus_step(xi_reps[:, :, 0], xi_reps[:, :, 1], h)
+
+        step_reps = G.exp_rep_grid(Omega)
+
+        pose_reps = np.empty((n_shapes, len(s_nodes), 3, 3))
+        pose_reps[:, 0] = G.identity_rep
+        for i in range(len(s_nodes) - 1):
+            pose_reps[:, i + 1] = np.matmul(pose_reps[:, i], step_reps[:, i])
+
+        return s_nodes, pose_reps, Omega
+
+    def integration_nodes(self,
+                          s_values=None,  # Arclength values to include as integration nodes
+                          n_steps=None):
+        """Integration nodes along the s span, the (n_nodes - 1, 1, 1) array of step lengths, and the
+        (n_nodes - 1, 2) array of Gauss points within each step"""
+
+        if n_steps is None:
+            n_steps = self.n_steps
+
+        # Integration nodes, including any requested arclengths
+        s_nodes = np.linspace(self.s_span[0], self.s_span[1], n_steps + 1)
+        if s_values is not None:
+            s_nodes = np.union1d(s_nodes, np.clip(np.ravel(s_values), self.s_span[0], self.s_span[1]))
+        h = np.diff(s_nodes)[:, None, None]
+
+        c = np.array([0.5 - np.sqrt(3) / 6, 0.5 + np.sqrt(3) / 6])
+        s_gauss = s_nodes[:-1, None] + c * h[:, :, 0]
+
+        return s_nodes, h, s_gauss
+
+    def velocity_reps(self,
+                      xi_list,  # Sequence of (n_points, n_dim) arrays of Lie algebra coordinates
+                      grid_shape):  # Shape to give the points of each array
+        """Matrix representations of a set of backbone velocity arrays"""
+
+        xi = np.array(xi_list)
+
+        return np.reshape(np.einsum('...k,kij->...ij', xi, self.Lie_alg_basis_reps),
+                          (len(xi),) + tuple(grid_shape) + (3, 3))
+
+    def tip_sensitivity(self,
+                        shape_parameters,
+                        t=0,
+                        output_frame="world",  # options are world, body, spatial
+                        n_steps=None,
+                        parameter_step=None):  # Step for differentiating the shape description function
+        """Pose of the backbone tip and its Jacobian with respect to the shape parameters, found in one pass along
+        the backbone. The body-frame sensitivity of the tip is the integral of Ad_{g(L)^-1 g(s)} d(xi)/dp over the
+        backbone. This is accumulated step by step as the exact derivative of the Magnus steps: each step
+        contributes dexp_{-Omega}(d(Omega)/dp), and the sum so far is carried forward by the Adjoint-inverse of the
+        step. Only the shape description function is differentiated numerically, so no extra backbone
+        integrations are needed.
+
+        The Jacobian is returned as an (n_dim, n_parameters) array in the same frame conventions as the kinematic
+        chains: 'world' gives the derivative of the tip's group value, 'body' the tip-frame velocity and
+        'spatial' the velocity at the identity"""
+
+        shape_parameters = np.asarray(shape_parameters, dtype=float)
+        n_parameters = shape_parameters.size
+
+        s_nodes, h, s_gauss = self.integration_nodes(None, n_steps)
+
+        # Body velocities at the Gauss points, and their derivatives with respect to each shape parameter
+        if parameter_step is None:
+            parameter_step = np.cbrt(np.finfo(float).eps) * (1 + np.abs(shape_parameters))
+        parameter_step = np.broadcast_to(parameter_step, shape_parameters.shape)
+
+        xi = self.backbone_velocity(shape_parameters, s_gauss.ravel(), t)
+        dxi = []
+        for j in range(n_parameters):
+            p_plus = shape_parameters.copy()
+            p_minus = shape_parameters.copy()
+            p_plus.flat[j] = p_plus.flat[j] + parameter_step.flat[j]
+            p_minus.flat[j] = p_minus.flat[j] - parameter_step.flat[j]
+            dxi.append((self.backbone_velocity(p_plus, s_gauss.ravel(), t)
+                        - self.backbone_velocity(p_minus, s_gauss.ravel(), t)) / (2 * parameter_step.flat[j]))
+
+        xi_reps = self.velocity_reps([xi], s_gauss.shape)[0]
+        dxi_reps = self.velocity_reps(dxi, s_gauss.shape)
+
+        # Magnus step elements and their derivatives (with parameters on the leading axis)
+        A1 = xi_reps[:, 0]
+        A2 = xi_reps[:, 1]
+        dA1 = dxi_reps[:, :, 0]
+        dA2 = dxi_reps[:, :, 1]
+
+        Omega = magnus_step(A1, A2, h)
+        dOmega = ((h / 2) * (dA1 + dA2)
+                  + (np.sqrt(3) * h ** 2 / 12) * (np.matmul(dA1, A2) - np.matmul(A2, dA1)
+                                                  + np.matmul(A1, dA2) - np.matmul(dA2, A1)))
+
+        step_reps = G.exp_rep_grid(Omega)
+
+        # Body-frame variation produced by each step, dexp_{-Omega}(dOmega), in Lie algebra coordinates
+        ad_Omega = self.ad_matrices(Omega)
+        dexp_minus = dexp_series(-ad_Omega)
+        dOmega_coordinates = np.moveaxis(G.Lie_alg_derep_grid(dOmega), 0, -1)
+        step_variation = np.matmul(dexp_minus, dOmega_coordinates)
+
+        # Adjoint-inverse of each step, which carries the variation so far to the end of the step
+        step_Ad_inv = G.Ad_inv_matrix_grid(step_reps)
+
+        # Accumulate the poses and the body-frame sensitivity along the backbone
+        tip_rep = G.identity_rep
+        J_body = np.zeros((3, n_parameters))
+        for i in range(len(step_reps)):
+            tip_rep = np.matmul(tip_rep, step_reps[i])
+            J_body = np.matmul(step_Ad_inv[i], J_body) + step_variation[i]
+
+        tip_value = G.derepresentation_grid(tip_rep)
+
+        if output_frame == "body":
+            J = J_body
+        elif output_frame == "spatial":
+            J = np.matmul(G.Ad_matrix_grid(tip_rep), J_body)
+        elif output_frame == "world":
+            J = np.matmul(G.TL_matrix_grid(tip_rep), J_body)
+        else:
+            raise ValueError(
+                f"Only body, spatial and world frame supported! you gave {output_frame}!"
+            )
+
+        return tip_value, J
+
+    def ad_matrices(self,
+                    Omega):
+        """Matrices of the Lie bracket [Omega, .] in Lie algebra coordinates, for an array of Lie algebra
+        matrix representations"""
+
+        brackets = (np.matmul(Omega[..., None, :, :], self.Lie_alg_basis_reps)
+                    - np.matmul(self.Lie_alg_basis_reps, Omega[..., None, :, :]))
+
+        return np.swapaxes(G.Lie_alg_derep_grid(brackets), -1, -2)
+
+    def backbone_poses(self,
+                       shape_parameters,
+                       s_values,
+                       t=0,
+                       output_reps=False):
+        """Poses of the backbone at an array of arclength values, as an (len(s_values), n_dim) array of group values
+        (and, if output_reps is True, an (len(s_values), 3, 3) array of their matrix representations)"""
+
+        solution = self.integrate_backbone(shape_parameters, t, s_values)
+
+        return solution.poses(s_values, output_reps)
+
+    def backbone_sweep(self,
+                       shape_parameter_array,  # (M, n_parameters) array of shape parameters
+                       s_values,  # Arclength values at which to report the poses
+                       t=0,  # Time for all the shapes, or an array of M times
+                       chunk_size=1000,  # Number of shapes integrated together
+                       n_processes=None,  # Number of worker processes to split the chunks over, if more than one
+                       dtype=float):  # Data type of the returned array (e.g., np.float32 for compact tables)
+        """Poses of the backbone at a set of arclength values for many shapes, returned as an
+        (M, len(s_values), n_dim) array. The shapes are integrated in lockstep in chunks, optionally spread over
+        several worker processes (started with the platform's default method, so the body is pickled to each worker
+        once)"""
+
+        shape_parameter_array = np.asarray(shape_parameter_array, dtype=float)
+        n_shapes = len(shape_parameter_array)
+        t_array = np.broadcast_to(np.asarray(t, dtype=float), (n_shapes,))
+        s_values = np.asarray(s_values, dtype=float)
+
+        chunks = [(shape_parameter_array[i:i + chunk_size], t_array[i:i + chunk_size], s_values)
+                  for i in range(0, n_shapes, chunk_size)]
+
+        if (n_processes is not None) and (n_processes > 1):
+            with multiprocessing.Pool(n_processes, initializer=_init_sweep_worker, initargs=(self,)) as pool:
+                chunk_results = pool.map(_backbone_sweep_chunk, chunks)
+        else:
+            chunk_results = [self.backbone_sweep_chunk(*chunk) for chunk in chunks]
+
+        return np.concatenate(chunk_results).astype(dtype)
+
+    def backbone_sweep_chunk(self,
+                             shape_parameter_array,
+                             t_array,
+                             s_values):
+        """Integrate a chunk of shapes together, returning their poses at the requested arclengths"""
+
+        s_nodes, pose_reps, _ = self.integrate_backbones(shape_parameter_array, t_array, s_values)
+
+        # The requested arclengths are integration nodes, so their poses can be read off directly
+        node_indices = np.searchsorted(s_nodes, np.clip(s_values, self.s_span[0], self.s_span[1]))
+
+        return G.derepresentation_grid(pose_reps[:, node_indices])
+
+    def outline(self,
+                n_outline=None):  # Number of points along each side of the outline
+        """Outline of the body at its current configuration, as a (2, 2 * n_outline) array of x and y values running
+        up one side of the backbone and back down the other. The sides are found by rotating the half-width offset
+        by the backbone angle at each point and adding it to the backbone position"""
+
+        if n_outline is None:
+            n_outline = self.outline_resolution
+
+        x, y, theta = self.backbone_samples(n_outline)
 
-        backbone_flow_field = tb.TangentVectorField(rb.SE2, backbone_flow_function)
+        offset_x = -np.sin(theta) * self.width / 2
+        offset_y = np.cos(theta) * self.width / 2
 
-        self.shape_locus = backbone_flow_field.integrate(self.s_span, self.group.identity_element())
+        return np.stack([np.concatenate([x + offset_x, (x - offset_x)[::-1]]),
+                         np.concatenate([y + offset_y, (y - offset_y)[::-1]])])
 
-    def draw(self, ax, **kwargs):
-        s_dense = np.linspace(self.s_span[0], self.s_span[1], 100)
+    def backbone_samples(self,
+                         n_samples):
+        """Backbone poses at evenly spaced arclengths, in component format. Samples are cached for each resolution
+        until the configuration changes"""
 
-        g_dense = G.element_set(ut.GridArray(self.shape_locus.sol(s_dense), 1), 0, 'component')
+        if n_samples not in self.backbone_sample_cache:
+            s_samples = np.linspace(self.s_span[0], self.s_span[1], n_samples)
+            self.backbone_sample_cache[n_samples] = self.shape_locus.sol(s_samples)
 
-        s_coarse = np.linspace(self.s_span[0], self.s_span[1], 10)
-        g_coarse = G.element_set(ut.GridArray(self.shape_locus.sol(s_coarse), 1), 0, 'component')
+        return self.backbone_sample_cache[n_samples]
 
-        topline = g_dense * rb.SE2.element([0, self.width / 2, 0])
-        bottomline = g_dense * rb.SE2.element([0, - self.width / 2, 0])
+    def draw(self,
+             ax,
+             n_outline=None,  # Number of points along each side of the outline
+             n_spots=None,  # Number of spots marked along the backbone
+             **kwargs):
 
-        boundaryline = rlgp.RepresentationLieGroupElementSet(topline.value + bottomline.value[::-1])
+        if n_spots is None:
+            n_spots = self.spot_resolution
 
-        ax.fill(*boundaryline.grid[:2], facecolor='white', edgecolor='black')
-        ax.scatter(*g_coarse.grid[:2], color=spot_color)
+        ax.fill(*self.outline(n_outline), facecolor='white', edgecolor='black')
+        ax.scatter(*self.backbone_samples(n_spots)[:2], color=spot_color)
 
         # Draw a ground point if provided
         if self.ground is not None:
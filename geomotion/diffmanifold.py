@@ -716,14 +716,42 @@ class TangentVectorField(md.ManifoldFunction):
             sig = signature(f)
             if len(sig.parameters) == 1:
                 # noinspection PyUnusedLocal
-                def def_function(q, t, *args):
-                    return ut.ensure_ndarray(f(q))
+                def def_function(q, t, *args, func=f):
+                    return ut.ensure_ndarray(func(q))
             else:
-                def def_function(q, t, *args):
-                    return ut.ensure_ndarray(f(q, t, *args))
+                def def_function(q, t, *args, func=f):
+                    return ut.ensure_ndarray(func(q, t, *args))
 
             def_function_list.append(def_function)
 
+        # ManifoldFunction evaluates the function for each chart on configurations expressed in that chart. Build a
+        # function for each chart that moves the configuration into the chart where the field is defined, and pushes
+        # the output into the basis matching the chart of the configuration
+        chart_function_list = []
+        chart_output_chart = []
+        chart_output_basis = []
+        for c in range(manifold.n_charts):
+
+            # Use the function defined on this chart if there is one, otherwise the first function that can be
+            # reached from this chart
+            if c in defining_chart:
+                k = defining_chart.index(c)
+            else:
+                k = next((j for j, d in enumerate(defining_chart) if manifold.transition_table[c][d] is not None), 0)
+
+            chart_function_list.append(self.chart_function(manifold,
+                                                           def_function_list[k],
+                                                           c,
+                                                           defining_chart[k],
+                                                           output_defining_basis[k]))
+            chart_output_chart.append(output_chart[k])
+            chart_output_basis.append(output_basis[k])
+
+        defining_chart = list(range(manifold.n_charts))
+        output_defining_basis = list(range(manifold.n_charts))
+        output_chart = chart_output_chart
+        output_basis = chart_output_basis
+
         def postprocess_function_single(q, v, function_index):
             output_vector = manifold.vector(q,
                                             v,
@@ -763,14 +791,47 @@ class TangentVectorField(md.ManifoldFunction):
         postprocess_function = [postprocess_function_single, postprocess_function_multiple]
 
         super().__init__(manifold,
-                         def_function,
-                         defining_chart,
+                         chart_function_list,
                          postprocess_function)
 
+        self.defining_chart = defining_chart
         self.output_defining_basis = output_defining_basis
         self.output_chart = output_chart
         self.output_basis = output_basis
 
+    @staticmethod
+    def chart_function(manifold, f, chart, defining_chart, output_defining_basis):
+        """Wrap a field function defined on defining_chart (with output in output_defining_basis) so that it takes
+        configurations in chart and returns vectors in the matching basis"""
+
+        # Fields that cannot be reached from the chart return NaN, matching the ManifoldFunction behavior
+        if (chart != defining_chart) and (manifold.transition_table[chart][defining_chart] is None):
+            return lambda q, t, *args: np.full(manifold.vector_shape, np.nan)
+        if (chart != output_defining_basis) and (manifold.transition_table[output_defining_basis][chart] is None):
+            return lambda q, t, *args: np.full(manifold.vector_shape, np.nan)
+
+        def chart_function(q, t, *args):
+
+            # Move the configuration into the defining chart and evaluate the field there
+            if chart == defining_chart:
+                q_defining = q
+            else:
+                q_defining = manifold.transition_table[chart][defining_chart](q)
+
+            v = f(q_defining, t, *args)
+
+            # Push the output vector into the basis associated with the input chart
+            if chart != output_defining_basis:
+                if output_defining_basis == defining_chart:
+                    q_basis = q_defining
+                else:
+                    q_basis = manifold.transition_table[chart][output_defining_basis](q)
+                v = np.matmul(manifold.transition_Jacobian_table[output_defining_basis][chart](q_basis), v)
+
+            return v
+
+        return chart_function
+
     def __call__(self,
                  config,
                  time=None,
@@ -858,7 +919,26 @@ class TangentVectorField(md.ManifoldFunction):
                   initial_config,
                   output_content='sol',
                   output_format=None,
+                  variational=False,
+                  parameters=None,
+                  jacobian_function=None,
+                  jacobian_method=None,
                   **kwargs):
+        """Integrate the flow of the field from initial_config over timespan. If parameters are provided, they are
+        passed to the field as an extra argument after time.
+
+        If variational is True, the variational (tangent linear) equations are integrated alongside the flow,
+        giving the Jacobian of the flowed configuration with respect to the initial configuration and (if parameters
+        are provided) with respect to the parameters, both in the chart of the initial configuration. With 'sol'
+        output, these are attached to the solution as sol.dq_dq0 and sol.dq_dp (with time as the last axis), and
+        sol.sol is restricted to the configuration, with sol.sol_variational giving the Jacobians at requested times.
+        With 'final' output, the Jacobians are returned after the final configuration.
+
+        The tangent linear equations need the Jacobian of the field's coordinate velocity (in the initial chart) with
+        respect to the configuration and parameters stacked together. If jacobian_function is provided, it is called
+        as jacobian_function(t, q) or jacobian_function(t, q, parameters) and should return this (n, n + n_p) matrix;
+        otherwise it is found numerically with jacobian_method, which is a name in md.jacobian_backends or a
+        callable taking a function and a point, and defaults to md.default_jacobian_method as in ManifoldMap."""
 
         # Verify that the initial configuration is a manifold element
         if not isinstance(initial_config, md.ManifoldElement):
@@ -877,34 +957,123 @@ class TangentVectorField(md.ManifoldFunction):
         else:
             raise Exception("Unsupported output content: ", output_content)
 
-        def flow_function(t, x):
+        # Extra arguments to pass through to the vector field
+        if parameters is None:
+            field_args = ()
+        else:
+            parameters = ut.ensure_ndarray(parameters)
+            field_args = (parameters,)
+
+        def flow_function(t, x, *args):
 
             # Turn the current numerical value into a configuration element in the same chart
             # as the initial configuration
             x_config = self.manifold.element(x, initial_config_chart)
 
             # Evaluate the vector field at that location
-            v = self.__call__(x_config, t)
+            v = self.__call__(x_config, t, *args)
 
             v_initial_chart = v.transition(initial_config_chart)
 
             # ravel required to match dimension of vector with dimension of state
             return np.ravel(v_initial_chart.value)
 
-        sol = solve_ivp(flow_function,
+        if not variational:
+
+            sol = solve_ivp(flow_function,
+                            timespan,
+                            initial_config.value,
+                            dense_output=True,
+                            args=field_args, **kwargs)
+
+            if output_content == 'sol':
+                return sol
+            else:
+                q_history = ut.GridArray(sol.y, 1).everse
+                q_final = q_history[-1]
+                if output_format == 'TangentVector':
+                    q_final = self.manifold.element(q_final, initial_config_chart)
+
+                return q_final
+
+        ######
+        # Augment the state with the Jacobians of the flow with respect to the initial configuration and parameters
+
+        n = self.manifold.n_dim
+        if parameters is None:
+            n_p = 0
+        else:
+            n_p = parameters.size
+
+        if jacobian_method is None:
+            jacobian_backend = md.jacobian_backends[md.default_jacobian_method]
+        elif callable(jacobian_method):
+            jacobian_backend = jacobian_method
+        else:
+            jacobian_backend = md.jacobian_backends[jacobian_method]
+
+        def split_state(z):
+            # Separate an augmented state (or a history of augmented states along the last axis) into the
+            # configuration and the two flow Jacobians
+            q = z[:n]
+            dq_dq0 = np.reshape(z[n:n + (n * n)], (n, n) + z.shape[1:])
+            dq_dp = np.reshape(z[n + (n * n):], (n, n_p) + z.shape[1:])
+            return q, dq_dq0, dq_dp
+
+        def variational_flow_function(t, z):
+
+            q, dq_dq0, dq_dp = split_state(z)
+
+            # Velocity along the flow
+            q_dot = flow_function(t, q, *field_args)
+
+            # Linearization of the field with respect to the configuration and parameters, taken in a single
+            # Jacobian evaluation over the stacked inputs
+            if jacobian_function is not None:
+                A = np.reshape(jacobian_function(t, q, *field_args), (n, n + n_p))
+            else:
+                def stacked_flow_function(qp):
+                    if n_p == 0:
+                        return flow_function(t, qp[:n])
+                    else:
+                        return flow_function(t, qp[:n], np.reshape(qp[n:], parameters.shape))
+
+                A = np.reshape(jacobian_backend(stacked_flow_function, np.concatenate([q, np.ravel(field_args)])),
+                               (n, n + n_p))
+            A_q = A[:, :n]
+            A_p = A[:, n:]
+
+            # Tangent linear equations
+            dq_dq0_dot = np.matmul(A_q, dq_dq0)
+            dq_dp_dot = np.matmul(A_q, dq_dp) + A_p
+
+            return np.concatenate([q_dot, np.ravel(dq_dq0_dot), np.ravel(dq_dp_dot)])
+
+        z_initial = np.concatenate([initial_config.value, np.ravel(np.eye(n)), np.zeros(n * n_p)])
+
+        sol = solve_ivp(variational_flow_function,
                         timespan,
-                        initial_config.value,
+                        z_initial,
                         dense_output=True, **kwargs)
 
         if output_content == 'sol':
+
+            # Split the augmented history, and restrict the dense output to the configuration
+            sol.y, sol.dq_dq0, sol.dq_dp = split_state(sol.y)
+            augmented_sol = sol.sol
+            sol.sol = lambda t_eval: split_state(augmented_sol(t_eval))[0]
+            sol.sol_variational = lambda t_eval: split_state(augmented_sol(t_eval))[1:]
+
             return sol
         else:
-            q_history = ut.GridArray(sol.y, 1).everse
-            q_final = q_history[-1]
+            q_final, dq_dq0_final, dq_dp_final = split_state(sol.y[:, -1])
             if output_format == 'TangentVector':
                 q_final = self.manifold.element(q_final, initial_config_chart)
 
-            return q_final
+            if parameters is None:
+                return q_final, dq_dq0_final
+            else:
+                return q_final, dq_dq0_final, dq_dp_final
 
     def exp(self,
             q0,
@@ -918,10 +1087,27 @@ class TangentVectorField(md.ManifoldFunction):
 class DifferentialMap(md.ManifoldFunction):
 
     def __init__(self,
-                 defining_map: md.ManifoldMap):
+                 defining_map: md.ManifoldMap,
+                 method='jacobian',
+                 jvp_function_list=None,
+                 step=None):
+        """method selects how vectors are pushed through the map:
+        'jacobian' forms the full numerical Jacobian of the map at each point and multiplies it into the vector
+        'jvp' takes a central difference of the map along each vector, evaluating the map over the whole grid at
+              once, which needs only two extra evaluations of the map per point
+
+        If jvp_function_list is provided (one function per chart, taking the numeric configuration, the numeric
+        vector, and any additional arguments to the map), it is used as an analytic Jacobian-vector product in
+        place of either numerical method. step optionally sets the relative size of the 'jvp' finite difference."""
 
         self.manifold = defining_map.manifold
         self.defining_map = defining_map
+        # The map is evaluated and differentiated with its output in the output defining chart, and the vectors are
+        # then transitioned into the output chart by the postprocessing
+        if defining_map.output_chart == defining_map.output_defining_chart:
+            self.defining_chart_map = defining_map
+        else:
+            self.defining_chart_map = defining_map.transition_output(defining_map.output_defining_chart)
         self.output_manifold = defining_map.output_manifold
         self.output_defining_chart = defining_map.output_defining_chart
         self.output_defining_basis = defining_map.output_defining_chart
@@ -929,6 +1115,21 @@ class DifferentialMap(md.ManifoldFunction):
         self.output_basis = defining_map.output_chart
         self.postprocess_function = [self.postprocess_function_single, self.postprocess_function_multiple]
 
+        if method not in ['jacobian', 'jvp']:
+            raise Exception("Unknown differentiation method " + str(method) + ", should be 'jacobian' or 'jvp'")
+
+        if (jvp_function_list is not None) and (not isinstance(jvp_function_list, list)):
+            jvp_function_list = [jvp_function_list]
+
+        # Central differences have their smallest combined truncation and roundoff error at a step size of about the
+        # cube root of machine precision
+        if step is None:
+            step = np.cbrt(np.finfo(float).eps)
+
+        self.method = method
+        self.jvp_function_list = jvp_function_list
+        self.step = step
+
 
     def postprocess_function_single(self, q, v, function_index):
         v_defining_output_chart = self.output_manifold.vector(q,
@@ -974,7 +1175,7 @@ class DifferentialMap(md.ManifoldFunction):
     def defining_map_numeric(self, q_numeric, function_index, *args, **kwargs):
         q_manifold = self.manifold.element(q_numeric, function_index[0])
 
-        q_out_manifold = self.defining_map(q_manifold, *args, **kwargs)
+        q_out_manifold = self.defining_chart_map(q_manifold, *args, **kwargs)
 
         q_out_numeric = q_out_manifold.value
 
@@ -1059,6 +1260,9 @@ class DifferentialMap(md.ManifoldFunction):
         config_grid_e = config_grid_c.everse
         vector_grid_e = vector_grid_c.everse
 
+        if (self.jvp_function_list is not None) or (self.method == 'jvp'):
+            return self.process_jvp(config_grid_e, vector_grid_e, function_index_list, *process_args, **kwargs)
+
         def defining_map_with_inputs(q, function_index):
             q_out = self.defining_map_numeric(q, function_index, *process_args, **kwargs)
 
@@ -1069,22 +1273,74 @@ class DifferentialMap(md.ManifoldFunction):
                                                                    function_index_list, config_grid_e.n_outer),
                                             config_grid_e.n_outer)
 
-        def diffdefining_function_with_inputs(q, v, function_index):
-            function_jacobian = ndt.Jacobian(lambda x: defining_map_with_inputs(x, function_index))
-            v_out = np.matmul(function_jacobian(q), v)
-
-            return v_out
+        # Evaluate the Jacobian of the map at each point (sharing any Jacobians cached by the map), and multiply it
+        # into the vector at that point
+        jacobian_grid_e = self.defining_map.jacobian_grid(config_grid_e, function_index_list, *process_args, **kwargs)
 
-        # Evaluate the Jacobian at each point with the vector at that point
-        output_vector_grid_e = ut.GridArray(ut.object_list_eval_threewise(diffdefining_function_with_inputs,
-                                                                          config_grid_e,
-                                                                          vector_grid_e,
-                                                                          function_index_list,
-                                                                          n_outer=config_grid_e.n_outer),
+        output_vector_grid_e = ut.GridArray(np.matmul(np.asarray(jacobian_grid_e),
+                                                      np.asarray(vector_grid_e)[..., None])[..., 0],
                                             n_outer=config_grid_e.n_outer)
 
         return output_config_grid_e, output_vector_grid_e
 
+    def defining_map_grid(self, config_grid_e, function_index_list, *args, **kwargs):
+        """Evaluate the defining map over an element-wise grid of configurations in a single call on an element
+        set, returning an element-wise grid of the numeric output values"""
+
+        # Strip the trailing singleton dimension from the function index grid to get a chart for each configuration
+        chart_grid = ut.GridArray(function_index_list[..., 0], config_grid_e.n_outer)
+
+        q_set = self.manifold.element_set(config_grid_e, chart_grid, 'element')
+
+        q_out_set = self.defining_chart_map(q_set, *args, **kwargs)
+
+        return q_out_set.grid.everse
+
+    def process_jvp(self, config_grid_e, vector_grid_e, function_index_list, *process_args, **kwargs):
+        """Push the vectors through the map as Jacobian-vector products, without forming the Jacobian"""
+
+        n_outer = config_grid_e.n_outer
+
+        # Evaluate the function over the configurations
+        output_config_grid_e = self.defining_map_grid(config_grid_e, function_index_list, *process_args, **kwargs)
+
+        if self.jvp_function_list is not None:
+
+            def jvp_with_inputs(q, v, function_index):
+                return ut.ensure_ndarray(self.jvp_function_list[function_index[0]](q, v, *process_args, **kwargs))
+
+            output_vector_grid_e = ut.GridArray(ut.object_list_eval_threewise(jvp_with_inputs,
+                                                                              config_grid_e,
+                                                                              vector_grid_e,
+                                                                              function_index_list,
+                                                                              n_outer=n_outer),
+                                                n_outer=n_outer)
+
+            return output_config_grid_e, output_vector_grid_e
+
+        # Scale the step along each vector to the size of the configuration and the length of the vector, so that the
+        # configuration perturbation is comparable to the step size relative to the configuration
+        config_norm = np.linalg.norm(np.asarray(config_grid_e), axis=-1, keepdims=True)
+        vector_norm = np.linalg.norm(np.asarray(vector_grid_e), axis=-1, keepdims=True)
+        zero_vector = (vector_norm == 0)
+        h = self.step * (1 + config_norm) / np.where(zero_vector, 1, vector_norm)
+
+        # Evaluate the map on either side of each configuration along its vector, and take the central difference
+        plus_grid_e = ut.GridArray(np.asarray(config_grid_e) + (h * np.asarray(vector_grid_e)), n_outer)
+        minus_grid_e = ut.GridArray(np.asarray(config_grid_e) - (h * np.asarray(vector_grid_e)), n_outer)
+
+        output_plus = self.defining_map_grid(plus_grid_e, function_index_list, *process_args, **kwargs)
+        output_minus = self.defining_map_grid(minus_grid_e, function_index_list, *process_args, **kwargs)
+
+        v_out = (np.asarray(output_plus) - np.asarray(output_minus)) / (2 * h)
+
+        # Zero vectors map to zero vectors
+        v_out = np.where(zero_vector, 0, v_out)
+
+        output_vector_grid_e = ut.GridArray(v_out, n_outer)
+
+        return output_config_grid_e, output_vector_grid_e
+
     def postprocess(self, input_configuration_grid, function_grid, function_index_list, value_type):
 
         vector_location_grid = function_grid[0]
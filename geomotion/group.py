@@ -1,4 +1,5 @@
 #! /usr/bin/python3
+import importlib
 import numpy as np
 from . import utilityfunctions as ut
 from . import manifold as md
@@ -8,6 +9,16 @@ from operator import methodcaller
 
 class Group(md.Manifold):
 
+    # Module and attribute name under which a module-level group can be found. Groups are usually built from lambda
+    # functions, which cannot be pickled, so groups with a reference are pickled as that reference instead (e.g., to
+    # send elements to worker processes)
+    pickle_reference = None
+
+    def __reduce_ex__(self, protocol):
+        if self.pickle_reference is not None:
+            return group_from_reference, self.pickle_reference
+        return super().__reduce_ex__(protocol)
+
     def __init__(self,
                  operation_list,
                  identity_list,
@@ -70,6 +81,11 @@ class Group(md.Manifold):
         return g
 
 
+def group_from_reference(module_name, group_name):
+    """Look up a module-level group from its pickle reference"""
+    return getattr(importlib.import_module(module_name), group_name)
+
+
 class GroupElement(md.ManifoldElement):
 
     def __init__(self,
@@ -1,4 +1,7 @@
 #! /usr/bin/python3
+import numpy as np
+import numdifftools as ndt
+from . import utilityfunctions as ut
 from . import manifold as md
 from . import group as gp
 from . import diffmanifold as tb
@@ -10,9 +13,15 @@ class LieGroup(gp.Group, tb.DiffManifold):
                  operation_list,
                  identity_list,
                  inverse_function_list=None,
-                 transition_table=((None,),)):
+                 transition_table=((None,),),
+                 lifted_action_cache_size=None,  # Number of lifted action matrices to cache (no caching if None)
+                 lifted_action_method='jacobian'):  # DifferentialMap method for the elements' TL and TR
         """A Lie group is both a group and a differentiable manifold, and inherits properties from both.
-        Additionally, it has generator fields generated by the derivatives of the group actions"""
+        Additionally, it has generator fields generated by the derivatives of the group actions.
+
+        The lifted actions TL and TR of the elements take the full numerical Jacobian of the group action by
+        default. Passing lifted_action_method='jvp' takes a central-difference Jacobian-vector product instead,
+        which is cheaper but less accurate"""
 
         gp.Group.__init__(self,
                           operation_list,
@@ -24,6 +33,19 @@ class LieGroup(gp.Group, tb.DiffManifold):
                                  transition_table,
                                  self.n_dim)
 
+        self.set_lifted_action_cache(lifted_action_cache_size)
+        self.lifted_action_method = lifted_action_method
+
+    def set_lifted_action_cache(self,
+                                max_size=1024):
+        """Store lifted action matrices as they are computed, keeping up to max_size of the most recently used ones.
+        The cache belongs to this group, and is turned off (and emptied) by passing None"""
+
+        if max_size is None:
+            self.lifted_action_cache = None
+        else:
+            self.lifted_action_cache = ut.LRUCache(max_size)
+
     def element(self,
                 value,
                 initial_chart=0):
@@ -153,12 +175,128 @@ class LieGroup(gp.Group, tb.DiffManifold):
                     chart=0):
         return self.generator_field_constructor(self.L_infinitesimal, h_delta, chart)
 
+    def TL_matrix(self,
+                  g,
+                  h):
+        """Matrix of the left lifted action T_hL_g, which maps velocities at h to velocities at gh. If either input is
+        an element set, an array of matrices is returned with the structure of the set on the leading axes"""
+        return self.lifted_action_matrices(g, h, 'left')
+
+    def TR_matrix(self,
+                  h,
+                  g):
+        """Matrix of the right lifted action T_gR_h, which maps velocities at g to velocities at gh. If either input is
+        an element set, an array of matrices is returned with the structure of the set on the leading axes"""
+        return self.lifted_action_matrices(h, g, 'right')
+
+    def lifted_action_matrices(self,
+                               acting,
+                               config,
+                               side):
+        """Find the lifted action matrices of the acting element(s) at the configuration element(s), reusing any
+        matrices already in the cache and computing the rest together"""
+
+        acting_list, config_list, outer_shape = element_pairs(acting, config)
+
+        cache = getattr(self, 'lifted_action_cache', None)
+
+        matrix_list = [None] * len(acting_list)
+        missing = []
+        for i, (a, c) in enumerate(zip(acting_list, config_list)):
+            if cache is not None:
+                key = lifted_action_key(a, c, side)
+                if key in cache:
+                    matrix_list[i] = cache[key]
+                    continue
+            missing.append(i)
+
+        if missing:
+            new_matrices = self.lifted_action_matrix_batch([acting_list[i] for i in missing],
+                                                           [config_list[i] for i in missing],
+                                                           side)
+            for i, matrix in zip(missing, new_matrices):
+                matrix_list[i] = matrix
+                if cache is not None:
+                    cache[lifted_action_key(acting_list[i], config_list[i], side)] = matrix
+
+        matrices = np.array(matrix_list)
+
+        if outer_shape is None:
+            return matrices[0]
+        else:
+            return np.reshape(matrices, tuple(outer_shape) + matrices.shape[1:])
+
+    def lifted_action_matrix_batch(self,
+                                   acting_list,
+                                   config_list,
+                                   side):
+        """Lifted action matrices for lists of paired acting and configuration elements. Groups with a faster way to
+        find many matrices at once can override this"""
+
+        return [self.lifted_action_matrix(a, c, side) for a, c in zip(acting_list, config_list)]
+
+    def lifted_action_matrix(self,
+                             acting,
+                             config,
+                             side):
+        """Numerically differentiate the group action of acting on config with respect to config"""
+
+        if side == 'left':
+            def action(x):
+                return (acting * self.element(x, config.current_chart)).value
+        else:
+            def action(x):
+                return (self.element(x, config.current_chart) * acting).value
+
+        return np.reshape(ndt.Jacobian(action)(config.value), (self.n_dim, self.n_dim))
+
     def R_generator(self,
                     h_delta,
                     chart=0):
         return self.generator_field_constructor(self.R_infinitesimal, h_delta, chart)
 
 
+def element_pairs(a, b):
+    """Pair up the elements of two arguments that are each either a single element or an element set, returning
+    flat lists of the paired elements and the shape of the set structure (None if both are single elements)"""
+
+    a_is_set = isinstance(a, md.ManifoldElementSet)
+    b_is_set = isinstance(b, md.ManifoldElementSet)
+
+    if a_is_set and b_is_set:
+        if a.shape != b.shape:
+            raise Exception("Cannot pair up element sets of different shapes")
+        outer_shape = a.shape
+    elif a_is_set:
+        outer_shape = a.shape
+    elif b_is_set:
+        outer_shape = b.shape
+    else:
+        return [a], [b], None
+
+    n_elements = int(np.prod(outer_shape))
+
+    if a_is_set:
+        a_list = ut.object_list_flatten(a.value)
+    else:
+        a_list = [a] * n_elements
+
+    if b_is_set:
+        b_list = ut.object_list_flatten(b.value)
+    else:
+        b_list = [b] * n_elements
+
+    return a_list, b_list, outer_shape
+
+
+def lifted_action_key(acting, config, side):
+    """Dictionary key identifying a lifted action matrix by the side of the action and the elements involved. Each
+    group has its own cache, so the group is not part of the key"""
+    return (side,
+            acting.current_chart, acting.value.tobytes(),
+            config.current_chart, config.value.tobytes())
+
+
 class LieGroupElement(gp.GroupElement):
 
     def __init__(self,
@@ -170,8 +308,8 @@ class LieGroupElement(gp.GroupElement):
                                  value,
                                  initial_chart)
 
-        self.TL = tb.DifferentialMap(self.L)
-        self.TR = tb.DifferentialMap(self.R)
+        self.TL = tb.DifferentialMap(self.L, group.lifted_action_method)
+        self.TR = tb.DifferentialMap(self.R, group.lifted_action_method)
 
         # Information about how to build a set of these objects
         self.plural = LieGroupElementSet
@@ -227,12 +365,20 @@ class LieGroupTangentVector(tb.TangentVector):
 
     @property
     def left(self):
-        left_velocity = self * self.configuration.inverse
+        g_inv = self.configuration.inverse
+        left_config = self.configuration * g_inv
+        left_value = np.matmul(self.group.TR_matrix(g_inv, self.configuration), self.value)
+        left_velocity = self.group.vector(left_config, left_value, left_config.current_chart,
+                                          left_config.current_chart)
         return left_velocity
 
     @property
     def right(self):
-        right_velocity = self.configuration.inverse * self
+        g_inv = self.configuration.inverse
+        right_config = g_inv * self.configuration
+        right_value = np.matmul(self.group.TL_matrix(g_inv, self.configuration), self.value)
+        right_velocity = self.group.vector(right_config, right_value, right_config.current_chart,
+                                           right_config.current_chart)
         return right_velocity
 
     @property
@@ -283,17 +429,37 @@ class LieGroupElementSet(gp.GroupElementSet):
         # Information about what this set should contain
         self.single = LieGroupElement
 
+    def lifted_action(self, other, side):
+        """Apply the left (side='left', g * v) or right (side='right', v * g) lifted action of every element in the
+        set to a single tangent vector, using the lifted action matrices of the group"""
+
+        group = self.manifold
+
+        if side == 'left':
+            config_set = self * other.configuration
+            matrices = group.TL_matrix(self, other.configuration)
+        else:
+            config_set = other.configuration * self
+            matrices = group.TR_matrix(self, other.configuration)
+
+        vector_values = np.reshape(np.matmul(matrices, other.value), (-1, group.n_dim))
+
+        vector_list = [group.vector(c, v, c.current_chart, c.current_chart)
+                       for c, v in zip(ut.object_list_flatten(config_set.value), vector_values)]
+
+        return LieGroupTangentVectorSet(ut.object_list_nest(vector_list, self.shape))
+
     def __mul__(self, other):
 
         if isinstance(other, LieGroupTangentVector):
-            return self.group_set_action(other, '__mul__')
+            return self.lifted_action(other, 'left')
         else:
             return gp.GroupElementSet.__mul__(self, other)
 
     def __rmul__(self, other):
 
         if isinstance(other, LieGroupTangentVector):
-            return self.group_set_action(other, '__rmul__')
+            return self.lifted_action(other, 'right')
         else:
             return gp.GroupElementSet.__rmul__(self, other)
 
@@ -1,11 +1,43 @@
 #! /usr/bin/python3
 from collections import UserList
 import numpy as np
+import numdifftools as ndt
 from operator import methodcaller
 from . import utilityfunctions as ut
 from . import core
 
 
+def numdifftools_jacobian(f, q):
+    """Jacobian of f at q from numdifftools (adaptive step with Richardson extrapolation)"""
+    return ndt.Jacobian(f)(q)
+
+
+def central_difference_jacobian(f, q):
+    """Jacobian of f at q from central differences, with the step in each coordinate scaled to its size"""
+    q = np.asarray(q, dtype=float)
+    h = np.cbrt(np.finfo(float).eps) * (1 + np.abs(q))
+
+    columns = []
+    for i in range(q.size):
+        q_plus = q.copy()
+        q_minus = q.copy()
+        q_plus[i] = q_plus[i] + h[i]
+        q_minus[i] = q_minus[i] - h[i]
+        columns.append((np.ravel(f(q_plus)) - np.ravel(f(q_minus))) / (2 * h[i]))
+
+    return np.stack(columns, axis=-1)
+
+
+# Differentiation methods available to ManifoldMap.jacobian, by name. Each takes a numeric function and a point, and
+# returns the Jacobian of the function at that point. Other methods can be added to this dictionary
+jacobian_backends = {'numdifftools': numdifftools_jacobian,
+                     'central': central_difference_jacobian}
+
+# Differentiation method used when none is specified, by ManifoldMap.jacobian and by the variational equations of
+# TangentVectorField.integrate
+default_jacobian_method = 'central'
+
+
 class Manifold:
     """
     Class to hold manifold structure
@@ -391,11 +423,17 @@ class ManifoldMap(ManifoldFunction):
                  output_manifold: Manifold,  # The manifold that output elements are part of
                  defining_function_list,  # The underlying numeric function
                  output_defining_chart=None,  # The output-manifold chart in which the function range is defined
-                 output_chart=None):  # An output chart to use, if different from the definition chart
+                 output_chart=None,  # An output chart to use, if different from the definition chart
+                 jacobian_function_list=None,  # Optional analytic Jacobians of the defining functions
+                 jacobian_method=None,  # Numerical differentiation method (default_jacobian_method if None)
+                 jacobian_cache_size=None):  # Number of Jacobians to cache (no caching if None)
 
         if not isinstance(defining_function_list, list):
             defining_function_list = [defining_function_list]
 
+        if (jacobian_function_list is not None) and (not isinstance(jacobian_function_list, list)):
+            jacobian_function_list = [jacobian_function_list]
+
         # if defining_chart is None:
         #     defining_chart = [0] * len(defining_function_list)
         # elif not isinstance(defining_chart, list):
@@ -451,10 +489,87 @@ class ManifoldMap(ManifoldFunction):
         self.output_chart = output_chart
         self.output_manifold = output_manifold
 
+        # Store the differentiation information. The Jacobian cache is off by default, and is turned on by giving a
+        # cache size, which bounds it to that many of the most recently used Jacobians
+        self.jacobian_function_list = jacobian_function_list
+        if jacobian_method is None:
+            jacobian_method = default_jacobian_method
+        self.jacobian_method = jacobian_method
+        if jacobian_cache_size is None:
+            self.jacobian_cache = None
+        else:
+            self.jacobian_cache = ut.LRUCache(jacobian_cache_size)
+
+    def jacobian(self, configuration, *args, **kwargs):
+        """Jacobian of the map at a ManifoldElement, or over a ManifoldElementSet (with the structure of the set on
+        the leading axes of the output). The Jacobian at each point is taken with respect to the chart the point is
+        expressed in, with output in the output defining chart of the map"""
+
+        configuration_grid_e, function_index_list, value_type = self.preprocess(configuration)
+
+        jacobian_grid = self.jacobian_grid(configuration_grid_e, function_index_list, *args, **kwargs)
+
+        if value_type == 'single':
+            return jacobian_grid[0]
+        else:
+            return np.asarray(jacobian_grid)
+
+    def jacobian_grid(self, configuration_grid_e, function_index_list, *args, **kwargs):
+        """Evaluate the Jacobian of the defining functions over an element-wise grid of configurations, returning a
+        GridArray with an m x n matrix at each point"""
+
+        n_outer = configuration_grid_e.n_outer
+
+        # Cached values are only used when no extra arguments are being passed to the defining functions
+        use_cache = (self.jacobian_cache is not None) and (not args) and (not kwargs)
+
+        def jacobian_at_point(q, function_index):
+
+            if use_cache:
+                key = (function_index[0], np.asarray(q).tobytes())
+                if key in self.jacobian_cache:
+                    return self.jacobian_cache[key]
+
+            if (self.jacobian_function_list is not None) and \
+                    (self.jacobian_function_list[function_index[0]] is not None):
+                J = ut.ensure_ndarray(self.jacobian_function_list[function_index[0]](q, *args, **kwargs))
+            else:
+                if callable(self.jacobian_method):
+                    backend = self.jacobian_method
+                else:
+                    backend = jacobian_backends[self.jacobian_method]
+
+                def defining_function_with_inputs(x):
+                    return np.ravel(self.defining_function_list[function_index[0]](x, *args, **kwargs))
+
+                J = backend(defining_function_with_inputs, np.asarray(q))
+
+            J = np.reshape(J, (-1, np.size(q)))
+
+            if use_cache:
+                self.jacobian_cache[key] = J
+
+            return J
+
+        return ut.GridArray(ut.array_eval_pairwise(jacobian_at_point,
+                                                   configuration_grid_e,
+                                                   function_index_list,
+                                                   n_outer),
+                            n_outer)
+
     def transition_output(self, new_output_chart):
-        return self.__class__(self.manifold,
-                              self.output_manifold,
-                              self.defining_function_list,
-                              self.defining_chart,
-                              self.output_defining_chart,
-                              new_output_chart)
+        if not isinstance(new_output_chart, list):
+            new_output_chart = [new_output_chart] * len(self.defining_function_list)
+
+        new_map = self.__class__(self.manifold,
+                                 self.output_manifold,
+                                 self.defining_function_list,
+                                 self.output_defining_chart,
+                                 new_output_chart,
+                                 self.jacobian_function_list,
+                                 self.jacobian_method)
+
+        # The Jacobians are of the defining functions, which do not depend on the output chart, so the cache is shared
+        new_map.jacobian_cache = self.jacobian_cache
+
+        return new_map
@@ -1,6 +1,7 @@
 import numpy as np
 from matplotlib import cm
 from matplotlib.colors import ListedColormap, LinearSegmentedColormap
+from matplotlib.animation import FuncAnimation, PillowWriter
 
 crimson = [234/255, 14/255, 30/255]
 
@@ -8,3 +9,28 @@ negative_colors = np.linspace([0, 0, 0], [1, 1, 1])
 positive_colors = np.linspace([1, 1, 1], crimson)
 
 crimson_cmp = ListedColormap(np.concatenate((negative_colors, positive_colors)))
+
+
+def animate_frames(figure,
+                   update_function,  # Function of the frame index that updates the artists and returns them
+                   n_frames,
+                   interval=50,  # Time between frames in milliseconds
+                   filename=None,  # If given, the animation is rendered to this file
+                   fps=None,  # Frame rate for the file, defaulting to the rate set by interval
+                   blit=True):
+    """Run update_function over the frames of an animation. The artists it updates should be created once before
+    the animation starts, so that each frame only sets their data, and only the changed artists are redrawn. If a
+    filename is given, the frames are rendered to it (as an animated gif through Pillow if the name ends in .gif,
+    and with the default matplotlib movie writer otherwise), which does not need an interactive backend"""
+
+    animation = FuncAnimation(figure, update_function, frames=n_frames, interval=interval, blit=blit)
+
+    if filename is not None:
+        if fps is None:
+            fps = 1000 / interval
+        if filename.endswith('.gif'):
+            animation.save(filename, writer=PillowWriter(fps=fps))
+        else:
+            animation.save(filename, fps=fps)
+
+    return animation
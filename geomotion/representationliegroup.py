@@ -15,7 +15,10 @@ class RepresentationLieGroup(rgp.RepresentationGroup, lgp.LieGroup):
                  identity,
                  derepresentation_function_list=None,
                  specification_chart=0,
-                 normalization_function=None
+                 normalization_function=None,
+                 vectorized=False,  # True if the rep and derep functions accept arrays of values/matrices
+                 action_function=None,  # Optional action of the group on points, (g_rep_grid, points) -> points
+                 log_function=None  # Optional closed-form logarithm, (g_rep_grid) -> xi_rep_grid
                  ):
         # Instantiate as a representation group
         rgp.RepresentationGroup.__init__(self,
@@ -32,10 +35,302 @@ class RepresentationLieGroup(rgp.RepresentationGroup, lgp.LieGroup):
                                  self.transition_table,
                                  self.n_dim)
 
+        # Record whether the representation and derepresentation functions can be applied to whole arrays, with the
+        # coordinates or matrices on the trailing axes
+        self.vectorized = vectorized
+
+        # Save the action of the group on points. If none is given, the representation acts on points directly, or
+        # on their homogeneous coordinates if the points have one fewer dimension than the representation
+        self.action_function = action_function
+
+        # Save the closed-form logarithm of the group, if there is one. Otherwise the general matrix logarithm is used
+        self.log_function = log_function
+
+        # Lifted action matrices are not cached unless set_lifted_action_cache is called
+        self.lifted_action_cache = None
+
         # Construct the differential representation functions
         self.representation_Jacobian_table = \
             [lambda x, func=rho: np.moveaxis(ndt.Jacobian(func)(x), 1, 0) for rho in self.representation_function_list]
 
+    def representation_grid(self,
+                            value_grid,
+                            chart=0):
+        """Evaluate the representation function over an array of configuration values whose last axis holds the
+        coordinates, returning an array whose last two axes hold the matrix representations"""
+
+        value_grid = np.asarray(value_grid, dtype=float)
+        outer_shape = value_grid.shape[:-1]
+
+        rho = self.representation_function_list[chart]
+
+        if self.vectorized:
+            return np.reshape(rho(value_grid), outer_shape + self.representation_shape)
+
+        rep_list = [rho(q) for q in np.reshape(value_grid, (-1, self.n_dim))]
+
+        return np.reshape(np.array(rep_list), outer_shape + self.representation_shape)
+
+    def derepresentation_grid(self,
+                              rep_grid,
+                              chart=0):
+        """Evaluate the derepresentation function over an array whose last two axes hold matrix representations,
+        returning an array whose last axis holds the configuration values"""
+
+        rep_grid = np.asarray(rep_grid, dtype=float)
+        outer_shape = rep_grid.shape[:-2]
+
+        derho = self.derepresentation_function_list[chart]
+
+        if self.vectorized:
+            return np.reshape(derho(rep_grid), outer_shape + (self.n_dim,))
+
+        value_list = [derho(r) for r in np.reshape(rep_grid, (-1,) + self.representation_shape)]
+
+        return np.reshape(np.array(value_list), outer_shape + (self.n_dim,))
+
+    def act_on_points(self,
+                      g,  # Group element, element set, or array of matrix representations
+                      points):  # Array of points, with the point coordinates on the last axis
+        """Apply the (left) action of group elements to an array of points, without lifting the points to group
+        elements. A single element acts on every point. An element set (or an (..., k, k) array of
+        representations) is broadcast against the points, so that with points of shape (n_points, d) each element
+        acts on all of them, returning (..., n_points, d), and with points of shape (..., n_points, d) each element
+        acts on its own points"""
+
+        if isinstance(g, rgp.RepresentationGroupElement):
+            g_rep_grid = g.rep
+        elif isinstance(g, rgp.RepresentationGroupElementSet):
+            g_rep_grid = np.array([g_i.rep for g_i in ut.object_list_flatten(g.value)])
+            g_rep_grid = np.reshape(g_rep_grid, tuple(ut.shape(g.value)) + self.representation_shape)
+        else:
+            g_rep_grid = g
+
+        g_rep_grid = np.asarray(g_rep_grid, dtype=float)
+        points = np.asarray(points, dtype=float)
+
+        if self.action_function is not None:
+            return self.action_function(g_rep_grid, points)
+
+        # Points in matrix-vector form, multiplied by the representations from the left. The element axes are
+        # placed before the point axis so that each element can act on all of the points
+        g_rep_grid = g_rep_grid[..., None, :, :]
+
+        if points.shape[-1] == self.representation_shape[-1]:
+            return np.matmul(g_rep_grid, points[..., None])[..., 0]
+        elif points.shape[-1] == self.representation_shape[-1] - 1:
+            homogeneous_points = np.concatenate([points, np.ones(points.shape[:-1] + (1,))], -1)
+            return np.matmul(g_rep_grid, homogeneous_points[..., None])[..., :-1, 0]
+        else:
+            raise Exception("Points do not have a dimension the group representation can act on")
+
+    def exp_rep_grid(self,
+                     xi_rep_grid):
+        """Exponentiate an array of Lie algebra matrix representations (on the last two axes of the array),
+        returning the matrix representations of the resulting group elements"""
+
+        return ut.stacked_expm(xi_rep_grid)
+
+    def log_rep_grid(self,
+                     g_rep_grid):
+        """Take the logarithm of an array of group element matrix representations (on the last two axes of the
+        array), returning the matrix representations of the resulting Lie algebra elements"""
+
+        if self.log_function is not None:
+            return self.log_function(np.asarray(g_rep_grid, dtype=float))
+
+        return ut.stacked_logm(g_rep_grid)
+
+    def representation_Jacobian_grid(self,
+                                     value_grid,
+                                     chart=0):
+        """Central-difference Jacobian of the representation function over an array of configuration values,
+        returning an array whose last three axes are the representation matrix axes and the coordinate axis"""
+
+        value_grid = np.asarray(value_grid, dtype=float)
+
+        # Scale the step in each coordinate to the size of that coordinate
+        h = np.cbrt(np.finfo(float).eps) * (1 + np.abs(value_grid))
+
+        J = np.empty(value_grid.shape[:-1] + self.representation_shape + (self.n_dim,))
+        for i in range(self.n_dim):
+            value_plus = value_grid.copy()
+            value_minus = value_grid.copy()
+            value_plus[..., i] = value_plus[..., i] + h[..., i]
+            value_minus[..., i] = value_minus[..., i] - h[..., i]
+
+            J[..., i] = ((self.representation_grid(value_plus, chart) - self.representation_grid(value_minus, chart))
+                         / (2 * h[..., i, None, None]))
+
+        return J
+
+    def velocity_derep_grid(self,
+                            value_grid,
+                            rep_velocity_grid,
+                            chart=0):
+        """Convert an array of matrix-representation velocities into coordinate velocities at an array of
+        configuration values, by applying the pseudo-inverse of the representation Jacobian at each point"""
+
+        J = self.representation_Jacobian_grid(value_grid, chart)
+
+        # Flatten the matrix axes of the Jacobians and velocities so that each point is a linear least-squares problem
+        J_flat = np.reshape(J, J.shape[:-3] + (-1, self.n_dim))
+        v_flat = np.reshape(rep_velocity_grid, J.shape[:-3] + (-1, 1))
+
+        return np.matmul(np.linalg.pinv(J_flat), v_flat)[..., 0]
+
+    def lifted_action_matrix_batch(self,
+                                   acting_list,
+                                   config_list,
+                                   side):
+        """Lifted action matrices found from the representation: the representation Jacobian at the configuration is
+        multiplied by the acting matrix on the appropriate side, and mapped back to coordinates at the product with
+        the pseudo-inverse of the representation Jacobian there. The pairs are processed together, in groups sharing
+        the chart of their configuration, with coordinates taken in that chart"""
+
+        charts = np.array([c.current_chart for c in config_list])
+        matrices = np.zeros((len(config_list), self.n_dim, self.n_dim))
+
+        for chart in np.unique(charts):
+            in_chart = np.flatnonzero(charts == chart)
+
+            acting_reps = np.array([acting_list[i].rep for i in in_chart])
+            config_values = np.array([config_list[i].value for i in in_chart])
+            config_reps = self.representation_grid(config_values, chart)
+
+            # Velocities of the configuration along each coordinate direction, in matrix form
+            J_config = self.representation_Jacobian_grid(config_values, chart)
+
+            # Carry the configuration velocities through the group action
+            if side == 'left':
+                product_reps = np.matmul(acting_reps, config_reps)
+                J_product = np.einsum('...ab,...bcn->...acn', acting_reps, J_config)
+            else:
+                product_reps = np.matmul(config_reps, acting_reps)
+                J_product = np.einsum('...abn,...bc->...acn', J_config, acting_reps)
+
+            if self.normalization_function is not None:
+                product_reps = np.array([self.normalization_function(r) for r in product_reps])
+
+            product_values = np.array([ut.ensure_ndarray(self.derepresentation_function_list[chart](r))
+                                       for r in product_reps])
+
+            # Convert the matrix velocities at the product into coordinates
+            J_out = self.representation_Jacobian_grid(product_values, chart)
+            J_out_flat = np.reshape(J_out, (-1, J_out[0].size // self.n_dim, self.n_dim))
+            J_product_flat = np.reshape(J_product, J_out_flat.shape)
+
+            matrices[in_chart] = np.matmul(np.linalg.pinv(J_out_flat), J_product_flat)
+
+        return matrices
+
+    def Lie_alg_rep(self,
+                    h_delta,
+                    chart=0):
+        """Matrix representation of a coordinate velocity at the identity"""
+
+        J_identity = self.representation_Jacobian_grid(self.identity_list[chart], chart)
+
+        return np.matmul(J_identity, ut.ensure_ndarray(h_delta))
+
+    def Lie_alg_basis_reps(self,
+                           chart=0):
+        """Matrix representations of the coordinate basis directions of the Lie algebra, stacked on the first axis"""
+
+        J_identity = self.representation_Jacobian_grid(self.identity_list[chart], chart)
+
+        return np.moveaxis(J_identity, -1, 0)
+
+    def Lie_alg_derep_grid(self,
+                           xi_rep_grid,
+                           chart=0):
+        """Convert an array of Lie algebra matrix representations (on the last two axes) into coordinates"""
+
+        J_identity = self.representation_Jacobian_grid(self.identity_list[chart], chart)
+        J_identity_flat = np.reshape(J_identity, (-1, self.n_dim))
+
+        xi_rep_grid = np.asarray(xi_rep_grid, dtype=float)
+        xi_flat = np.reshape(xi_rep_grid, xi_rep_grid.shape[:-2] + (-1, 1))
+
+        return np.matmul(np.linalg.pinv(J_identity_flat), xi_flat)[..., 0]
+
+    def Ad_matrix_grid(self,
+                       g_rep_grid,
+                       chart=0):
+        """Adjoint matrices of an array of group elements given by their matrix representations (on the last two
+        axes). Column k of each matrix is the conjugation g E_k g^-1 of the kth Lie algebra basis direction"""
+
+        g_rep_grid = np.asarray(g_rep_grid, dtype=float)[..., None, :, :]
+
+        conjugated_basis = np.matmul(np.matmul(g_rep_grid, self.Lie_alg_basis_reps(chart)), np.linalg.inv(g_rep_grid))
+
+        return np.swapaxes(self.Lie_alg_derep_grid(conjugated_basis, chart), -1, -2)
+
+    def Ad_inv_matrix_grid(self,
+                           g_rep_grid,
+                           chart=0):
+        """Adjoint-inverse matrices of an array of group elements given by their matrix representations (on the last
+        two axes). Column k of each matrix is the conjugation g^-1 E_k g of the kth Lie algebra basis direction"""
+
+        g_rep_grid = np.asarray(g_rep_grid, dtype=float)[..., None, :, :]
+
+        conjugated_basis = np.matmul(np.matmul(np.linalg.inv(g_rep_grid), self.Lie_alg_basis_reps(chart)), g_rep_grid)
+
+        return np.swapaxes(self.Lie_alg_derep_grid(conjugated_basis, chart), -1, -2)
+
+    def TL_matrix_grid(self,
+                       g_rep_grid,
+                       chart=0):
+        """Matrices of the left lifted action T_e L_g from the Lie algebra to the tangent space at each of an array of
+        group elements given by their matrix representations (on the last two axes)"""
+
+        g_rep_grid = np.asarray(g_rep_grid, dtype=float)
+
+        return self.lifted_basis_matrix_grid(g_rep_grid,
+                                             np.matmul(g_rep_grid[..., None, :, :], self.Lie_alg_basis_reps(chart)),
+                                             chart)
+
+    def TR_matrix_grid(self,
+                       g_rep_grid,
+                       chart=0):
+        """Matrices of the right lifted action T_e R_g from the Lie algebra to the tangent space at each of an array
+        of group elements given by their matrix representations (on the last two axes)"""
+
+        g_rep_grid = np.asarray(g_rep_grid, dtype=float)
+
+        return self.lifted_basis_matrix_grid(g_rep_grid,
+                                             np.matmul(self.Lie_alg_basis_reps(chart), g_rep_grid[..., None, :, :]),
+                                             chart)
+
+    def lifted_basis_matrix_grid(self,
+                                 g_rep_grid,
+                                 lifted_basis_reps,
+                                 chart=0):
+        """Convert matrix velocities of the lifted Lie algebra basis directions at each group element into coordinates,
+        returning them as the columns of a matrix at each element"""
+
+        J = self.representation_Jacobian_grid(self.derepresentation_grid(g_rep_grid, chart), chart)
+        J_flat = np.reshape(J, J.shape[:-3] + (-1, self.n_dim))
+
+        lifted_basis_flat = np.reshape(lifted_basis_reps, lifted_basis_reps.shape[:-2] + (-1,))
+
+        # The representation Jacobian has full column rank, so the least-squares solution can be found from the
+        # normal equations, which is much faster over large stacks than a pseudo-inverse
+        J_flat_T = np.swapaxes(J_flat, -1, -2)
+
+        return np.linalg.solve(np.matmul(J_flat_T, J_flat),
+                               np.matmul(J_flat_T, np.swapaxes(lifted_basis_flat, -1, -2)))
+
+    def L_generator(self,
+                    h_delta,
+                    chart=0):
+        return RepresentationGeneratorField(self, h_delta, 'left', chart)
+
+    def R_generator(self,
+                    h_delta,
+                    chart=0):
+        return RepresentationGeneratorField(self, h_delta, 'right', chart)
+
     def element(self,
                 representation,
                 initial_chart=0):
@@ -116,15 +411,18 @@ class RepresentationLieGroupElement(lgp.LieGroupElement, rgp.RepresentationGroup
                                                 representation,
                                                 initial_chart)
 
-        self.TL = lambda x: RepresentationLieGroupTangentVector(self.group,
-                                                                self * x.configuration,
-                                                                np.matmul(self.rep, x.rep),
-                                                                self.current_chart)
+    # The lifted actions are methods rather than per-element lambdas, so that elements can be pickled
+    def TL(self, x):
+        return RepresentationLieGroupTangentVector(self.group,
+                                                   self * x.configuration,
+                                                   np.matmul(self.rep, x.rep),
+                                                   self.current_chart)
 
-        self.TR = lambda x: RepresentationLieGroupTangentVector(self.group,
-                                                                x.configuration * self,
-                                                                np.matmul(x.rep, self.rep),
-                                                                self.current_chart)
+    def TR(self, x):
+        return RepresentationLieGroupTangentVector(self.group,
+                                                   x.configuration * self,
+                                                   np.matmul(x.rep, self.rep),
+                                                   self.current_chart)
 
     @property
     def log(self):
@@ -147,21 +445,33 @@ class RepresentationLieGroupTangentVector(lgp.LieGroupTangentVector):
                  initial_basis=0):
         """Tangent vector with extra group properties"""
 
+        # Coordinate value of the vector, if it is already known
+        self.value_cache = None
+
+        # The representation is passed through the value setter, which forwards it to the rep setter once the
+        # configuration has been set up
         lgp.LieGroupTangentVector.__init__(self,
                                            group,
                                            configuration,
-                                           group.identity_derep,
-                                           # This is to get something of the right shape, rep overrides whatever we have here
+                                           representation,
                                            initial_chart,
                                            initial_basis)
 
-        self.rep = representation
-
         # Information about how to build a set of these objects
         self.plural = RepresentationLieGroupTangentVectorSet
 
     @property
     def rep(self):
+
+        # Vectors specified by their coordinates build their matrix representation when it is first needed
+        if self._representation is None:
+            # Multiply the matrices in the Jacobian of the representation function by the list of provided coefficients
+            J_rep = self.group.representation_Jacobian_table[self.configuration.current_chart](self.configuration.value)
+            matrix_representation = np.zeros_like(J_rep[0])
+            for i, J_i in enumerate(J_rep):
+                matrix_representation = matrix_representation + J_i * self.value_cache[i]
+            self._representation = matrix_representation
+
         return self._representation
 
     @rep.setter
@@ -171,23 +481,22 @@ class RepresentationLieGroupTangentVector(lgp.LieGroupTangentVector):
         # Make sure that the provided representation is an ndarray
         representation = ut.ensure_ndarray(representation)
 
-        # Force the representation into matrix form if it is not already in matrix form
+        # Store the matrix representation if one was provided, otherwise hold on to the coordinates and defer building
+        # the matrix form until it is requested
         if representation.ndim == 2:
             # If the representation is a matrix, assume that it is a proper representation
-            matrix_representation = representation
+            self._representation = representation
+            self.value_cache = None
         elif representation.ndim == 1:
-            # Multiply the matrices in the Jacobian of the representation function by the list of provided coefficients
-            J_rep = self.group.representation_Jacobian_table[self.configuration.current_chart](self.configuration.value)
-            matrix_representation = np.zeros_like(J_rep[0])
-            for i, J_i in enumerate(J_rep):
-                matrix_representation = matrix_representation + J_i * representation[i]
-
-        # Store the matrix representation
-        self._representation = matrix_representation
+            self._representation = None
+            self.value_cache = representation
 
     @property
     def value(self):
 
+        if self.value_cache is not None:
+            return self.value_cache
+
         J_rep = self.group.representation_Jacobian_table[self.configuration.current_chart](self.configuration.value)
         J_rep_vectorized = np.concatenate([ut.column(np.ravel(x)) for x in J_rep], 1)
         rep_vectorized = ut.column(np.ravel(self.rep))
@@ -202,6 +511,17 @@ class RepresentationLieGroupTangentVector(lgp.LieGroupTangentVector):
         # Pass the value input into the representation setter (which will force it to matrix form)
         self.rep = val
 
+    @property
+    def left(self):
+        # The lifted actions of representation group elements are direct matrix products
+        left_velocity = self * self.configuration.inverse
+        return left_velocity
+
+    @property
+    def right(self):
+        right_velocity = self.configuration.inverse * self
+        return right_velocity
+
     @property
     def exp_L(self):
 
@@ -241,6 +561,135 @@ class RepresentationLieGroupElementSet(rgp.RepresentationGroupElementSet, lgp.Li
         # Information about what this set should contain
         self.single = RepresentationLieGroupElement
 
+    def lifted_action(self, other, side):
+        """Apply the left (side='left', g * v) or right (side='right', v * g) lifted action of every element in the
+        set to a single tangent vector, multiplying the matrix representations as stacks and converting the results
+        to coordinates at all points together"""
+
+        group = self.manifold
+
+        # Stack the representations of the set elements, with the set structure on the outer axes
+        g_reps = ut.nested_stack(ut.object_list_eval(lambda g: g.rep, self.value))
+        outer_shape = g_reps.shape[:-2]
+        g_charts = ut.object_list_eval(lambda g: g.current_chart, self.value)
+
+        # Multiply the matrix representations of the configurations and velocities
+        if side == 'left':
+            config_reps = np.matmul(g_reps, other.configuration.rep)
+            vector_reps = np.matmul(g_reps, other.rep)
+        else:
+            config_reps = np.matmul(other.configuration.rep, g_reps)
+            vector_reps = np.matmul(other.rep, g_reps)
+
+        if group.normalization_function is not None:
+            config_reps = np.reshape(np.array([group.normalization_function(c)
+                                               for c in np.reshape(config_reps, (-1,) + group.representation_shape)]),
+                                     config_reps.shape)
+
+        # Build the output configurations, in the charts of the acting elements
+        config_reps = np.reshape(config_reps, (-1,) + group.representation_shape)
+        vector_reps = np.reshape(vector_reps, (-1,) + group.representation_shape)
+        charts = np.ravel(np.array(g_charts))
+        config_list = [group.element(c, chart) for c, chart in zip(config_reps, charts)]
+        config_values = np.array([c.value for c in config_list])
+
+        # Find the coordinate values of the vectors for all the points in each chart together
+        vector_values = np.empty_like(config_values)
+        for chart in np.unique(charts):
+            in_chart = (charts == chart)
+            vector_values[in_chart] = group.velocity_derep_grid(config_values[in_chart], vector_reps[in_chart], chart)
+
+        # Build the vectors from their matrix representations, recording the already-computed coordinate values
+        vector_list = []
+        for c, v_rep, v_val in zip(config_list, vector_reps, vector_values):
+            v = RepresentationLieGroupTangentVector(group, c, v_rep, c.current_chart)
+            v.value_cache = v_val
+            vector_list.append(v)
+
+        # Restore the nesting of the original set
+        return RepresentationLieGroupTangentVectorSet(ut.object_list_nest(vector_list, outer_shape))
+
+    def __mul__(self, other):
+
+        if isinstance(other, RepresentationLieGroupTangentVector):
+            return self.lifted_action(other, 'left')
+        else:
+            return lgp.LieGroupElementSet.__mul__(self, other)
+
+    def __rmul__(self, other):
+
+        if isinstance(other, RepresentationLieGroupTangentVector):
+            return self.lifted_action(other, 'right')
+        else:
+            return lgp.LieGroupElementSet.__rmul__(self, other)
+
+
+class RepresentationGeneratorField(tb.TangentVectorField):
+    """Generator field of a representation Lie group, whose value at g is the derivative of the left
+    (side='left', xi * g) or right (side='right', g * xi) group action in the direction h_delta from the identity.
+    These are evaluated in closed form from the matrix representations rather than by differentiating the group
+    action numerically"""
+
+    def __init__(self,
+                 group: RepresentationLieGroup,
+                 h_delta,
+                 side='left',
+                 chart=0):
+
+        if side not in ['left', 'right']:
+            raise Exception("Generator field side should be 'left' or 'right'")
+
+        self.group = group
+        self.h_delta = ut.ensure_ndarray(h_delta)
+        self.side = side
+        self.chart = chart
+
+        # Matrix representation of the generating direction
+        self.xi_rep = group.Lie_alg_rep(self.h_delta, chart)
+
+        tb.TangentVectorField.__init__(self,
+                                       group,
+                                       self.generator_function,
+                                       chart,
+                                       chart)
+
+    def generator_rep_grid(self, rep_grid):
+        """Matrix representation of the generator field at an array of representation matrices"""
+        if self.side == 'left':
+            return np.matmul(self.xi_rep, rep_grid)
+        else:
+            return np.matmul(rep_grid, self.xi_rep)
+
+    def generator_function(self, g_value):
+
+        g_rep = self.group.representation_grid(g_value, self.chart)
+
+        return self.group.velocity_derep_grid(g_value, self.generator_rep_grid(g_rep), self.chart)
+
+    def process(self, configuration_grid_e, function_index_list, *process_args, **kwargs):
+
+        # Points in other charts go through the per-chart wrapping in TangentVectorField
+        if not np.all(np.asarray(function_index_list) == self.chart):
+            return tb.TangentVectorField.process(self, configuration_grid_e, function_index_list,
+                                                 *process_args, **kwargs)
+
+        # Evaluate the field at all points together
+        value_grid = np.asarray(configuration_grid_e)
+        rep_grid = self.group.representation_grid(value_grid, self.chart)
+        vector_grid = self.group.velocity_derep_grid(value_grid, self.generator_rep_grid(rep_grid), self.chart)
+
+        return ut.GridArray(vector_grid, configuration_grid_e.n_outer)
+
+    def transition_output(self, new_output_basis, new_output_chart='match'):
+
+        new_field = self.__class__(self.group, self.h_delta, self.side, self.chart)
+        if new_output_chart == 'match':
+            new_output_chart = new_output_basis
+        new_field.output_basis = [new_output_basis] * self.group.n_charts
+        new_field.output_chart = [new_output_chart] * self.group.n_charts
+
+        return new_field
+
 
 class RepresentationLieGroupTangentVectorSet(lgp.LieGroupTangentVectorSet):
     pass
@@ -3,6 +3,7 @@ from geomotion import group as gp
 from geomotion import utilityfunctions as ut
 import numpy as np
 from matplotlib import pyplot as plt
+from matplotlib.collections import PolyCollection, LineCollection
 from operator import methodcaller
 
 spot_color = gplt.crimson
@@ -10,23 +11,31 @@ spot_color = gplt.crimson
 
 
 def SE2_rep(g_value):
-    x = g_value[0]
-    y = g_value[1]
-    theta = g_value[2]
+    # Written with trailing-axis indexing so that it also accepts arrays of values
+    g_value = np.asarray(g_value, dtype=float)
 
-    g_rep = [[np.cos(theta), -np.sin(theta), x],
-             [np.sin(theta), np.cos(theta), y],
-             [0, 0, 1]]
+    x = g_value[..., 0]
+    y = g_value[..., 1]
+    theta = g_value[..., 2]
+
+    zero = np.zeros_like(theta)
+    one = np.ones_like(theta)
+
+    g_rep = np.stack([np.stack([np.cos(theta), -np.sin(theta), x], -1),
+                      np.stack([np.sin(theta), np.cos(theta), y], -1),
+                      np.stack([zero, zero, one], -1)], -2)
 
     return g_rep
 
 
 def SE2_derep(g_rep):
-    x = g_rep[0][2]
-    y = g_rep[1][2]
-    theta = np.arctan2(g_rep[1][0], g_rep[0][0])
+    g_rep = np.asarray(g_rep, dtype=float)
+
+    x = g_rep[..., 0, 2]
+    y = g_rep[..., 1, 2]
+    theta = np.arctan2(g_rep[..., 1, 0], g_rep[..., 0, 0])
 
-    g_value = [x, y, theta]
+    g_value = np.stack([x, y, theta], -1)
     return g_value
 
 
@@ -40,7 +49,37 @@ def SE2_normalize(g_rep):
     return (g_rep_normalized)
 
 
-SE2 = rlgp.RepresentationLieGroup(SE2_rep, [0, 0, 0], SE2_derep, 0, SE2_normalize)
+def SE2_log_rep(g_rep):
+    # Closed-form logarithm, written with trailing-axis indexing so that it also accepts arrays of representations.
+    # The rotation angle comes straight from the rotation block, and the translation is mapped back through the
+    # inverse of V(theta) = (sin(theta) I + (1 - cos(theta)) J) / theta
+    g_rep = np.asarray(g_rep, dtype=float)
+
+    theta = np.arctan2(g_rep[..., 1, 0], g_rep[..., 0, 0])
+    x = g_rep[..., 0, 2]
+    y = g_rep[..., 1, 2]
+
+    # V^-1 = [[a, theta/2], [-theta/2, a]] with a = (theta/2) cot(theta/2), using its series near theta = 0
+    half_theta = 0.5 * theta
+    small = np.abs(theta) < 1e-4
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = np.where(small, 1 - (theta ** 2) / 12, half_theta * np.cos(half_theta) / np.sin(half_theta))
+
+    v_x = a * x + half_theta * y
+    v_y = -half_theta * x + a * y
+
+    zero = np.zeros_like(theta)
+
+    xi_rep = np.stack([np.stack([zero, -theta, v_x], -1),
+                       np.stack([theta, zero, v_y], -1),
+                       np.stack([zero, zero, zero], -1)], -2)
+
+    return xi_rep
+
+
+SE2 = rlgp.RepresentationLieGroup(SE2_rep, [0, 0, 0], SE2_derep, 0, SE2_normalize, vectorized=True,
+                                  log_function=SE2_log_rep)
+SE2.pickle_reference = (__name__, 'SE2')
 
 
 class RigidBodyPlotInfo:
@@ -70,18 +109,16 @@ class RigidBodyPlotInfo:
 
 def cornered_triangle(configuration, r, spot_color, **kwargs):
 
+    # The corners are plain planar points, which the body position acts on directly
     def T1(body):
-        return SE2.element_set(ut.GridArray([[r, 0, 0],
-                                       [r * np.cos(2 * np.pi / 3), r * np.sin(2 * np.pi / 3), 0],
-                                       [r * np.cos(4 * np.pi / 3), r * np.sin(4 * np.pi / 3), 0]], 1),
-                         0, "element")
+        return np.array([[r, 0],
+                         [r * np.cos(2 * np.pi / 3), r * np.sin(2 * np.pi / 3)],
+                         [r * np.cos(4 * np.pi / 3), r * np.sin(4 * np.pi / 3)]])
 
     def T2(body):
-        return SE2.element_set(ut.GridArray([[r, 0, 0],
-                                       [r / 3 * np.cos(2 * np.pi / 3) + (2 * r / 3), r / 3 * np.sin(2 * np.pi / 3), 0],
-                                       [r / 3 * np.cos(4 * np.pi / 3) + (2 * r / 3), r / 3 * np.sin(4 * np.pi / 3), 0]],
-                                      1),
-                         0, "element")
+        return np.array([[r, 0],
+                         [r / 3 * np.cos(2 * np.pi / 3) + (2 * r / 3), r / 3 * np.sin(2 * np.pi / 3)],
+                         [r / 3 * np.cos(4 * np.pi / 3) + (2 * r / 3), r / 3 * np.sin(4 * np.pi / 3)]])
 
     plot_locus = [T1, T2]
 
@@ -93,6 +130,13 @@ def cornered_triangle(configuration, r, spot_color, **kwargs):
     return RigidBody(plot_info, configuration)
 
 
+def plot_function_list(plot_info, n_locus):
+    """List of plot functions with one entry per plot locus, repeating the last entry if fewer were given (so that
+    the default ['fill'] applies to every locus)"""
+    plot_function = ut.ensure_list(plot_info.plot_function)
+    return plot_function + [plot_function[-1]] * (n_locus - len(plot_function))
+
+
 class RigidBody:
 
     def __init__(self,
@@ -101,25 +145,372 @@ class RigidBody:
         self.plot_info = plot_info
         self.position = position
 
+        # Body-local drawing points, computed from the plot locus functions on first use
+        self.local_plot_geometry = None
+
+    def clear_plot_cache(self):
+        """Discard the cached body-local drawing points, e.g. after changing plot_info or anything that the plot
+        locus functions depend on"""
+        self.local_plot_geometry = None
+
+    def local_plot_points(self):
+        """Body-local drawing points for each plot locus, as (n_points, 2) arrays of planar points. Plot locus
+        functions can return the points directly, or as a set of SE2 elements (whose angles are ignored). The plot
+        locus functions are evaluated once and the results are cached"""
+
+        if self.local_plot_geometry is None:
+            self.local_plot_geometry = []
+            for p in self.plot_info.plot_locus:
+                locus = p(self)
+                if isinstance(locus, rlgp.RepresentationLieGroupElementSet):
+                    locus = np.transpose(np.asarray(locus.grid)[:2])
+                self.local_plot_geometry.append(np.asarray(locus, dtype=float))
+
+        return self.local_plot_geometry
+
+    def plot_points(self,
+                    position_rep=None):
+        """World-frame drawing points for each plot locus, as (..., 2, n_points) arrays of x and y coordinates. The
+        body position acts directly on the cached local points. position_rep defaults to the representation of the
+        body's position, and can also be an (..., 3, 3) stack of positions"""
+
+        if position_rep is None:
+            position_rep = self.position.rep
+
+        return [np.swapaxes(SE2.act_on_points(position_rep, local_points), -1, -2)
+                for local_points in self.local_plot_points()]
+
     def draw(self,
              axis):
-        plot_locus = self.plot_info.plot_locus
+
+        return self.plot_artists(axis, self.plot_points())
+
+    def plot_artists(self,
+                     axis,
+                     plot_points_global_list):
+        """Create the artists for each plot locus from world-frame drawing points, returning them in a list"""
+
         plot_options = self.plot_info.plot_style
-        plot_function = self.plot_info.plot_function
+        plot_function = plot_function_list(self.plot_info, len(plot_points_global_list))
 
-        for i, p in enumerate(plot_locus):
-            # Transform the locally expressed positions of the drawing points by the position of the body
-            plot_locus_global = self.position * p(self)
-            plot_locus_global_grid = plot_locus_global.grid
+        artists = []
+        for i, plot_points_global in enumerate(plot_points_global_list):
+            # The locally expressed positions of the drawing points have been transformed by the position of the body
 
             if plot_function[i] == 'fill':
-                axis.fill(*plot_locus_global_grid[:2], **(plot_options[i]))
+                artists.append(axis.fill(*plot_points_global, **(plot_options[i]))[0])
             elif plot_function[i] == 'plot':
-                axis.plot(*plot_locus_global_grid[:2], **(plot_options[i]))
+                artists.append(axis.plot(*plot_points_global, **(plot_options[i]))[0])
             elif plot_function[i] == 'scatter':
-                axis.scatter(*plot_locus_global_grid[:2], **(plot_options[i]))
+                artists.append(axis.scatter(*plot_points_global, **(plot_options[i])))
             else:
                 raise Exception("Unknown plot_function specification")
-            #print(plot_points_global_grid[0], "\n", plot_points_global_grid[1])
 
-        return
+        return artists
+
+    def animate(self,
+                axis,
+                trajectory,  # (n_frames, 3) array of positions, or a list of group elements
+                interval=50,  # Time between frames in milliseconds
+                filename=None,  # If given, the animation is rendered to this file
+                fps=None,
+                blit=True):
+        """Animate the body moving along a trajectory of positions. The drawing points for every frame are found
+        together from the cached local geometry, and the artists are created once and have their data replaced at
+        each frame"""
+
+        # Get the matrix representations of the positions along the trajectory
+        if isinstance(trajectory[0], rlgp.RepresentationLieGroupElement):
+            trajectory_reps = np.array([g.rep for g in trajectory])
+        else:
+            trajectory_reps = SE2.representation_grid(np.asarray(trajectory, dtype=float))
+
+        # Drawing points for each locus, as (n_frames, 2, n_points) arrays
+        frame_points = self.plot_points(trajectory_reps)
+
+        artists = self.plot_artists(axis, [points[0] for points in frame_points])
+        plot_function = plot_function_list(self.plot_info, len(frame_points))
+
+        # Fit the axis to the whole trajectory, since the limits are not updated while blitting
+        all_points = np.concatenate([np.reshape(np.moveaxis(points, -2, 0), (2, -1)) for points in frame_points], 1)
+        axis.update_datalim(all_points.T)
+        axis.autoscale_view()
+
+        def update(frame):
+            for artist, function, points in zip(artists, plot_function, frame_points):
+                set_artist_points(artist, function, points[frame])
+            return artists
+
+        return gplt.animate_frames(axis.figure, update, len(trajectory_reps), interval, filename, fps, blit)
+
+
+class RigidBodyScene:
+    """Renderer for many rigid bodies at once. The plot loci of all the bodies are gathered by plot function and
+    style, and each group is drawn as a single matplotlib collection (a PolyCollection for filled loci, a
+    LineCollection for lines, and one scatter for points), so that drawing and redrawing the scene does not pay a
+    per-artist cost for every body"""
+
+    def __init__(self,
+                 bodies):  # List of RigidBody objects
+        self.bodies = bodies
+        self.groups = None
+        self.collections = None
+
+    def group_loci(self):
+        """Group the (body, locus) pairs of the scene by plot function and style"""
+
+        groups = {}
+        for b, body in enumerate(self.bodies):
+            n_locus = len(body.local_plot_points())
+            plot_function = plot_function_list(body.plot_info, n_locus)
+            for i in range(n_locus):
+                style = body.plot_info.plot_style[i]
+                key = (plot_function[i], repr(sorted(style.items())))
+                if key not in groups:
+                    groups[key] = {'plot_function': plot_function[i], 'style': style, 'loci': []}
+                groups[key]['loci'].append((b, i))
+
+        return list(groups.values())
+
+    def group_points(self,
+                     group):
+        """World-frame drawing points for each locus in a group, found with one batched product for each set of
+        loci that share a number of points"""
+
+        local_points = [self.bodies[b].local_plot_points()[i] for b, i in group['loci']]
+        position_reps = [self.bodies[b].position.rep for b, _ in group['loci']]
+
+        if all(p.shape == local_points[0].shape for p in local_points):
+            return np.swapaxes(SE2.act_on_points(np.array(position_reps), np.array(local_points)), -1, -2)
+        else:
+            return [np.transpose(SE2.act_on_points(g, p)) for g, p in zip(position_reps, local_points)]
+
+    def draw(self,
+             axis):
+        """Add one collection per group of loci to the axis, returning the collections"""
+
+        self.groups = self.group_loci()
+        self.collections = []
+
+        for group in self.groups:
+            points = self.group_points(group)
+            plot_function = group['plot_function']
+
+            if plot_function == 'fill':
+                collection = PolyCollection([np.transpose(p) for p in points], **group['style'])
+                axis.add_collection(collection)
+            elif plot_function == 'plot':
+                collection = LineCollection([np.transpose(p) for p in points], **group['style'])
+                axis.add_collection(collection)
+            elif plot_function == 'scatter':
+                collection = axis.scatter(*np.concatenate(list(points), axis=-1), **group['style'])
+            else:
+                raise Exception("Unknown plot_function specification")
+
+            self.collections.append(collection)
+
+        axis.autoscale_view()
+
+        return self.collections
+
+    def update(self):
+        """Move the drawn collections to the current positions of the bodies, with one call per collection"""
+
+        for group, collection in zip(self.groups, self.collections):
+            points = self.group_points(group)
+            plot_function = group['plot_function']
+
+            if plot_function == 'fill':
+                collection.set_verts([np.transpose(p) for p in points])
+            elif plot_function == 'plot':
+                collection.set_segments([np.transpose(p) for p in points])
+            elif plot_function == 'scatter':
+                collection.set_offsets(np.transpose(np.concatenate(list(points), axis=-1)))
+
+        return self.collections
+
+
+def pose_rep(position):
+    """Matrix representation of a planar pose given as an SE2 element or as an [x, y, theta] value"""
+    if isinstance(position, rlgp.RepresentationLieGroupElement):
+        return np.asarray(position.rep, dtype=float)
+    else:
+        return SE2.representation_grid(np.asarray(position, dtype=float))
+
+
+class SceneNode:
+    """Node of a scene graph, holding a pose relative to its parent node (or to the world, for a root node) and
+    optionally a rigid body that is placed at the node's world pose. World poses are cached, and changing a
+    node's relative pose marks it and its subtree as needing recalculation"""
+
+    def __init__(self,
+                 relative_position=SE2.identity_element(),
+                 body=None,  # RigidBody to keep at the world position of this node
+                 parent=None):  # Parent SceneNode
+
+        self.body = body
+        self.parent = None
+        self.children = []
+
+        self.relative_rep = pose_rep(relative_position)
+        self.world_rep_cache = None
+
+        # A dirty node always has dirty descendants, so marking can stop at nodes that are already dirty
+        self.dirty = True
+
+        if parent is not None:
+            parent.add_child(self)
+
+    def add_child(self,
+                  child):
+        child.parent = self
+        self.children.append(child)
+        child.dirty = False
+        child.mark_dirty()
+
+        return child
+
+    def mark_dirty(self):
+        """Mark this node and its subtree as needing their world poses recalculated"""
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node.dirty:
+                node.dirty = True
+                stack.extend(node.children)
+
+    @property
+    def relative_position(self):
+        return SE2.element(self.relative_rep)
+
+    @relative_position.setter
+    def relative_position(self, position):
+        self.relative_rep = pose_rep(position)
+        self.dirty = False
+        self.mark_dirty()
+
+    @property
+    def world_rep(self):
+        """Matrix representation of the world pose of the node, recalculated only if the node is dirty"""
+
+        if self.dirty:
+            if self.parent is None:
+                self.set_world_rep(self.relative_rep)
+            else:
+                self.set_world_rep(np.matmul(self.parent.world_rep, self.relative_rep))
+
+        return self.world_rep_cache
+
+    @property
+    def world_position(self):
+        return SE2.element(self.world_rep)
+
+    def set_world_rep(self,
+                      world_rep):
+        """Store a recalculated world pose, and move the node's body to it"""
+
+        self.world_rep_cache = world_rep
+        self.dirty = False
+
+        if self.body is not None:
+            self.body.position = SE2.element(world_rep)
+
+
+class SceneGraph:
+    """Collection of scene-graph trees, whose dirty world poses can be updated together (one stacked matrix product
+    per level of the trees), and whose bodies can be drawn as a RigidBodyScene"""
+
+    def __init__(self,
+                 roots):  # Root SceneNode or list of root nodes
+        self.roots = ut.ensure_list(roots)
+        self.scene = None
+
+    def levels(self):
+        """Nodes of the graph grouped by depth, with the roots at depth zero"""
+
+        levels = []
+        level = list(self.roots)
+        while level:
+            levels.append(level)
+            level = [child for node in level for child in node.children]
+
+        return levels
+
+    @property
+    def nodes(self):
+        return [node for level in self.levels() for node in level]
+
+    def set_relative_positions(self,
+                               nodes,
+                               positions):  # Sequence of SE2 elements, or an (n_nodes, 3) array of values
+        """Change the relative poses of several nodes, and update the world poses"""
+
+        if not isinstance(positions, (list, tuple)):
+            positions = pose_rep(positions)
+
+        for node, position in zip(nodes, positions):
+            if isinstance(position, np.ndarray) and position.ndim == 2:
+                node.relative_rep = position
+                node.dirty = False
+                node.mark_dirty()
+            else:
+                node.relative_position = position
+
+        self.update()
+
+    def update(self):
+        """Recalculate the world poses of all dirty nodes, working down the trees one level at a time so that each
+        level is a single stacked matrix product"""
+
+        for level in self.levels():
+            dirty_nodes = [node for node in level if node.dirty]
+            if not dirty_nodes:
+                continue
+
+            parent_reps = np.array([SE2.identity_rep if node.parent is None else node.parent.world_rep_cache
+                                    for node in dirty_nodes])
+            relative_reps = np.array([node.relative_rep for node in dirty_nodes])
+
+            world_reps = np.matmul(parent_reps, relative_reps)
+
+            for node, world_rep in zip(dirty_nodes, world_reps):
+                node.set_world_rep(world_rep)
+
+    def world_positions(self):
+        """World poses of all the nodes (in the order of self.nodes), as an (n_nodes, 3) array of values"""
+
+        self.update()
+
+        return SE2.derepresentation_grid(np.array([node.world_rep_cache for node in self.nodes]))
+
+    def draw(self,
+             axis):
+        """Draw the bodies of the graph at their world poses"""
+
+        self.update()
+        self.scene = RigidBodyScene([node.body for node in self.nodes if node.body is not None])
+
+        return self.scene.draw(axis)
+
+    def redraw(self):
+        """Update the world poses and move the drawn bodies to them"""
+
+        self.update()
+
+        return self.scene.update()
+
+
+def set_artist_points(artist,
+                      plot_function,
+                      plot_points):
+    """Replace the points drawn by an artist with a (2, n_points) array of x and y coordinates"""
+
+    if plot_function == 'fill':
+        artist.set_xy(plot_points.T)
+    elif plot_function == 'plot':
+        artist.set_data(plot_points[0], plot_points[1])
+    elif plot_function == 'scatter':
+        artist.set_offsets(plot_points.T)
+    else:
+        raise Exception("Unknown plot_function specification")
@@ -1,5 +1,6 @@
 #! /usr/bin/python3
 import warnings
+from collections import OrderedDict
 import numpy as np
 
 
@@ -326,6 +327,126 @@ def nested_stack(array_list, n_outer=None, depth=0):
         return np.stack(array_list)
 
 
+def object_list_flatten(object_list):
+    """Drill down through a nested list, collecting its contents into a single flat list"""
+    if not isinstance(object_list, list):
+        return [object_list]
+
+    return [x for item in object_list for x in object_list_flatten(item)]
+
+
+def object_list_nest(flat_list, list_shape):
+    """Arrange the contents of a flat list into a nested list with the specified shape (the inverse of
+    object_list_flatten)"""
+    if len(list_shape) <= 1:
+        return list(flat_list)
+
+    n_inner = int(np.prod(list_shape[1:]))
+    return [object_list_nest(flat_list[i * n_inner:(i + 1) * n_inner], list_shape[1:]) for i in range(list_shape[0])]
+
+
+class LRUCache(OrderedDict):
+    """Dictionary that holds at most max_size entries, dropping the least recently used entry when a new one would
+    go past the limit. Used for the optional caches of Jacobians and lifted action matrices"""
+
+    def __init__(self, max_size=1024):
+        super().__init__()
+        self.max_size = max_size
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+def stacked_expm(A, order=12):
+    """Matrix exponential of each square matrix in an array whose last two axes hold the matrices, using Taylor
+    series with scaling and squaring so that the whole stack is processed with batched matrix products"""
+
+    A = np.asarray(A, dtype=float)
+
+    if A.size == 0:
+        return A.copy()
+
+    # Choose one scaling for the whole stack, so that the largest scaled matrix has norm at most 1/2
+    norm_max = np.max(np.sum(np.abs(A), axis=-2))
+    n_squarings = max(0, int(np.ceil(np.log2(norm_max / 0.5)))) if norm_max > 0 else 0
+
+    A_scaled = A / (2 ** n_squarings)
+
+    # Evaluate the Taylor series in Horner form
+    identity = np.eye(A.shape[-1])
+    E = A_scaled / order + identity
+    for k in range(order - 1, 0, -1):
+        E = np.matmul(A_scaled, E)
+        E /= k
+        E += identity
+
+    # Undo the scaling
+    for _ in range(n_squarings):
+        E = np.matmul(E, E)
+
+    return E
+
+
+def stacked_logm(A, order=15, sqrt_iterations=50, max_roots=64, tolerance=1e-10):
+    """Matrix logarithm of each square matrix in an array whose last two axes hold the matrices, using inverse
+    scaling and squaring: square roots are taken (by Denman-Beavers iteration) until the matrices are close to
+    the identity, and the logarithm is then found from its inverse-hyperbolic-tangent series. Matrices without a
+    principal logarithm (e.g., rotations by pi) make the square roots fail to converge, which raises an exception"""
+
+    A = np.asarray(A, dtype=float)
+
+    if A.size == 0:
+        return A.copy()
+
+    identity = np.eye(A.shape[-1])
+
+    # Take square roots of the whole stack until the matrix furthest from the identity is within 1/4 of it
+    n_roots = 0
+    while np.max(np.sum(np.abs(A - identity), axis=-2)) > 0.25:
+        if n_roots >= max_roots:
+            raise Exception("Matrix logarithm did not converge: matrices did not approach the identity after "
+                            + str(max_roots) + " square roots")
+
+        Y = A
+        Z = np.broadcast_to(identity, A.shape)
+        residual = np.inf
+        with np.errstate(all="ignore"):
+            for _ in range(sqrt_iterations):
+                try:
+                    Y, Z = 0.5 * (Y + np.linalg.inv(Z)), 0.5 * (Z + np.linalg.inv(Y))
+                except np.linalg.LinAlgError:
+                    break
+                residual = np.max(np.abs(np.matmul(Y, Y) - A))
+                if residual < 1e-14 * max(1.0, np.max(np.abs(A))):
+                    break
+
+        if not (residual <= tolerance * max(1.0, np.max(np.abs(A)))):
+            raise Exception("Matrix logarithm did not converge: square root iteration failed, the matrices may "
+                            "have eigenvalues on the negative real axis")
+
+        A = Y
+        n_roots = n_roots + 1
+
+    # log(A) = 2 atanh(X), with X = (A - I)(A + I)^-1
+    X = np.matmul(A - identity, np.linalg.inv(A + identity))
+    X_squared = np.matmul(X, X)
+
+    L = np.broadcast_to(identity / order, A.shape)
+    for k in range(order - 2, 0, -2):
+        L = np.matmul(X_squared, L) + identity / k
+    L = 2 * np.matmul(X, L)
+
+    return L * (2 ** n_roots)
+
+
 def shape(a):
     if not isinstance(a, list):
         return []
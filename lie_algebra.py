@@ -1,28 +1,58 @@
 import numpy as np
 import numdifftools as nd
 from repgroup import RepGroup, RepGroupElement
+from convenience import config_key
+from geomotion.utilityfunctions import LRUCache
 from vector import VectorBases, TangentVector
 
-def derivative_group_action_bases(direction: RepGroupElement, config: RepGroupElement, action = "left"):
-    def func(direction, config, i, action, delta):
-        if isinstance(delta, np.ndarray):
-            delta = delta.flatten()[0]
-        flattened_direction = direction.derepresentation.flatten()
-        flattened_direction[i] = flattened_direction[i] + delta
-        new_basis = RepGroupElement(value=flattened_direction, group=direction.group)
-        if action == "left":
-            return new_basis.left_action(config).value
-        elif action == "right":
-            return new_basis.right_action(config).value
-        else:
-            raise ValueError("Invalid action")
+def representation_derivative(direction: RepGroupElement):
+    """ Derivatives of the representation with respect to each coordinate of direction
+
+    :param direction: group element whose coordinates are perturbed
+    :returns np.ndarray: shape (n, m, m), the m x m matrix derivative for each of the n coordinates
+    """
+    group = direction.group
+    flattened_direction = np.asarray(direction.derepresentation, dtype=float).flatten()
+    rep_shape = np.shape(direction.value)
+    reduced_rep = lambda q: np.asarray(group.representation(q), dtype=float).flatten()
+    jacobian = np.asarray(nd.Jacobian(reduced_rep)(flattened_direction)).reshape(rep_shape + flattened_direction.shape)
+    return np.moveaxis(jacobian, -1, 0)
+
+def derivative_group_action_reps(direction: RepGroupElement, configs: list, action = "left"):
+    """ Derivatives of the group action of direction on each config, along each coordinate of direction
+
+    The action is linear in the representation, so the derivative along coordinate i is E_i @ h for the left action
+    and h @ E_i for the right action, where E_i is the representation derivative at direction. E_i is taken once
+    and shared by all of the configurations.
+
+    :param direction: group element whose coordinates are perturbed
+    :param configs: list of group elements the action is evaluated at
+    :param action: "left" or "right"
+    :returns np.ndarray: shape (N, n, m, m), the derivative matrix for each config and basis direction
+    """
+    basis_reps = representation_derivative(direction)
+    config_reps = np.array([config.value for config in configs], dtype=float)
+    if action == "left":
+        return np.matmul(basis_reps[None, :, :, :], config_reps[:, None, :, :])
+    elif action == "right":
+        return np.matmul(config_reps[:, None, :, :], basis_reps[None, :, :, :])
+    else:
+        raise ValueError("Invalid action")
+
+def derivative_group_action_basis_matrices(direction: RepGroupElement, configs: list, action = "left"):
+    """ Derepresented derivatives of the group action of direction on each config
+
+    :returns np.ndarray: shape (N, n, n), the derivative for each config (rows of basis directions, columns of
+    coordinates)
+    """
+    deriv_reps = derivative_group_action_reps(direction, configs, action)
+    derep = direction.group.derepresentation_fn
+    return np.array([[np.asarray(derep(d), dtype=float).flatten() for d in config_derivs]
+                     for config_derivs in deriv_reps])
 
+def derivative_group_action_bases(direction: RepGroupElement, config: RepGroupElement, action = "left"):
     gtvs = []
-    flattened_direction = direction.derepresentation.flatten()
-    for i in range(flattened_direction.shape[0]):
-        reduced_group_action = lambda delta: func(direction, config, i, action, delta)
-        deriv = nd.Derivative(reduced_group_action)(0.)
-        # print(f'deriv: {deriv} at config {config} for basis g{i}')
+    for deriv in derivative_group_action_reps(direction, [config], action)[0]:
         gtv = GroupTangentVector(val=RepGroupElement(value=deriv, group=direction.group), config=config)
         gtvs.append(gtv)
     return gtvs
@@ -68,22 +98,25 @@ class GroupVectorBases(object):
     def evaluate(self, elem, action = "left", in_vb_form = True):
         """ Evaluate coordinate basis of elem at list of initialised configurations using action.
         in_vb_form: True returns list of TangentVectors for each basis useful for plotting
-        else Returns nparray of GroupTangentVector of shape (configs, basis_vectors)"""
-        group_tangent_bases = np.array([derivative_group_action_bases(direction=elem, config=vector, action=action) for vector in self.vectors], dtype=GroupTangentVector)
+        else Returns nparray of shape (configs, basis_vectors, coordinates)"""
+        group_tangent_bases = derivative_group_action_basis_matrices(direction=elem, configs=self.vectors, action=action)
         if not in_vb_form:
             return group_tangent_bases
-        # shape = (configs, basis_vectors)
+        # shape = (configs, basis_vectors, coordinates)
         # per basis list
+        configs = [vector.derepresentation for vector in self.vectors]
         vblist = []
         for i in range(0, group_tangent_bases.shape[1]):
-            vb = VectorBases([gtv.as_tv() for gtv in group_tangent_bases[:, i]], inverse=group_tangent_bases[0][i].group.identity)
+            vb = VectorBases([TangentVector(value=group_tangent_bases[j, i], config=config) for j, config in enumerate(configs)], inverse=elem.group.identity)
             vblist.append(vb)
         return vblist
 
 class LieGroup(RepGroup):
-    def __init__(self, represent, depresent, identity):
+    def __init__(self, represent, depresent, identity, cache_size=1024):
         super().__init__(represent, depresent, identity)
         self.bases = lambda h: GroupVectorBases([h])
+        # representation derivatives, keyed on configuration coordinates
+        self.rep_derivative_cache = LRUCache(cache_size)
 
     def element(self, value):
         return LieGroupElement(self, value, self.left_lifted_action, self.right_lifted_action)
@@ -91,35 +124,81 @@ class LieGroup(RepGroup):
     def identity_element(self):
         return self.element(self.identity)
 
+    def representation_derivatives(self, configs: list):
+        """ Representation derivatives at each config, shape (N, n, m, m), reusing any already in the cache """
+        derivatives = []
+        for config in configs:
+            key = config_key(config.derepresentation)
+            if key not in self.rep_derivative_cache:
+                self.rep_derivative_cache[key] = representation_derivative(config)
+            derivatives.append(self.rep_derivative_cache[key])
+        return np.array(derivatives)
+
+    # Lifted actions: The lifted action matrix is the derivative of derep(g @ rep(h)) with respect to the coordinates
+    # of h. For matrix groups the chain rule gives it in closed form from the representation derivatives: moving
+    # along coordinate j of h moves the product by D_j = g @ E_j(h) (left) or E_j(h) @ g (right). D_j is tangent to
+    # the group at the product gh, whose coordinate directions are E_i(gh), so the lifted action matrix is
+    # pinv([E_i(gh)]) @ [D_j] with the matrices flattened into columns. Only the representation derivatives are
+    # found numerically, once per configuration, and they are cached.
+    def lifted_actions(self, acting, configs, action = "left"):
+        """ Batched lifted action matrices of the acting element(s) at the configuration element(s).
+        acting and configs are each a single element or a list of elements (a single element is paired with every
+        element of the other list). Returns nparray of shape (N, n, n)"""
+        if not isinstance(acting, (list, tuple)):
+            acting = [acting]
+        if not isinstance(configs, (list, tuple)):
+            configs = [configs]
+        n_pairs = max(len(acting), len(configs))
+        if len(acting) == 1:
+            acting = list(acting) * n_pairs
+        if len(configs) == 1:
+            configs = list(configs) * n_pairs
+        if len(acting) != len(configs):
+            raise ValueError("Acting and configuration lists must have the same length")
+
+        acting_reps = np.array([g.value for g in acting], dtype=float)
+        config_reps = np.array([h.value for h in configs], dtype=float)
+        config_derivs = self.representation_derivatives(configs)
+        if action == "left":
+            product_reps = np.matmul(acting_reps, config_reps)
+            moved_derivs = np.matmul(acting_reps[:, None, :, :], config_derivs)
+        elif action == "right":
+            product_reps = np.matmul(config_reps, acting_reps)
+            moved_derivs = np.matmul(config_derivs, acting_reps[:, None, :, :])
+        else:
+            raise ValueError("Invalid action")
+        product_derivs = self.representation_derivatives([self.element(p) for p in product_reps])
+
+        # flatten each derivative matrix into a column
+        product_columns = np.swapaxes(product_derivs.reshape(n_pairs, product_derivs.shape[1], -1), -1, -2)
+        moved_columns = np.swapaxes(moved_derivs.reshape(n_pairs, moved_derivs.shape[1], -1), -1, -2)
+        return np.matmul(np.linalg.pinv(product_columns), moved_columns)
+
     # Left lifted action: A function that takes in two instances of the “group element”
-    # class and returns the matrix Th Lg . In Python, this function can be written
-    # to automatically generate the lifted action matrix from the group action by
-    # wrapping a lambda function around the operation g * h that locks in the
-    # acting element g and exposes the current-configuration element h, then using
-    # numdifftools.Jacobian to take the derivative with respect to the current-
-    # configuration element.
+    # class and returns the matrix Th Lg, the derivative of g * h with respect to the
+    # current-configuration element h.
     def left_lifted_action(self, g, h_config):
-        group = g.group
-        reprshape = group.identity_element().derepresentation.shape
-        reduced_func = lambda h: g.left_action(group.element(h.reshape(reprshape))).derepresentation
-        jacobian = nd.Jacobian(reduced_func)
-        jacobian_matrix = jacobian(h_config.derepresentation)
-        return jacobian_matrix
+        return self.lifted_actions([g], [h_config], "left")[0]
 
     # ii. Right lifted action: A function that takes in a second instance of the group
-    # class and returns the matrix Tg Rh . In Python, this function can be written
-    # to automatically generate the lifted action matrix from the group action by
-    # wrapping a lambda function around the operation g * h that locks in the
-    # acting element h and exposes the current-configuration element g, then using
-    # numdifftools.Jacobian to take the derivative with respect to the current-
-    # configuration element.
+    # class and returns the matrix Tg Rh, the derivative of g * h with respect to the
+    # current-configuration element g.
     def right_lifted_action(self, h, g_config):
-        group = h.group
-        reprshape = group.identity_element().derepresentation.shape
-        reduced_func = lambda g: h.right_action(group.element(g.reshape(reprshape))).derepresentation
-        jacobian = nd.Jacobian(reduced_func)
-        jacobian_matrix = jacobian(g_config.derepresentation)
-        return jacobian_matrix
+        return self.lifted_actions([h], [g_config], "right")[0]
+
+    def ad_matrices(self, elements: list):
+        """ Batched adjoint matrices TgRginv @ TeLg of each element, nparray of shape (N, n, n) """
+        identity = self.identity_element()
+        inverses = [g.inverted_element for g in elements]
+        return np.matmul(self.lifted_actions(inverses, elements, "right"),
+                         self.lifted_actions(elements, identity, "left"))
+
+    def ad_inv_matrices(self, elements: list):
+        """ Batched inverse adjoint matrices TgLginv @ TeRg of each element, nparray of shape (N, n, n) """
+        identity = self.identity_element()
+        inverses = [g.inverted_element for g in elements]
+        return np.matmul(self.lifted_actions(inverses, elements, "left"),
+                         self.lifted_actions(elements, identity, "right"))
 
     # def TL(self, gdotatq):
     #     """maps gdotatg to hgdotatg"""
@@ -153,20 +232,13 @@ class LieGroupElement(RepGroupElement):
 
     def ad(self, gcircright: RepGroupElement):
         """Lifted adjoint action"""
-        # return self.inverted_element.right_lifted_action(self.left_lifted_action(gcircright))
-        g = self
-        ginv = g.inverted_element
-        TgRginv = self.right_lifted_action(ginv, g)
-        TeLg = self.left_lifted_action(g, self.group.identity_element())
-        return self.group.element(value=TgRginv @ TeLg @ gcircright.derepresentation)
+        # TgRginv @ TeLg, from the closed-form lifted actions
+        return self.group.element(value=self.group.ad_matrices([self])[0] @ gcircright.derepresentation)
 
     def ad_inv(self, gcircleft: RepGroupElement):
         """Lifted adjoint inv action"""
-        g = self
-        ginv = g.inverted_element
-        TgLginv = self.left_lifted_action(ginv, g)
-        TeRg = self.right_lifted_action(g, self.group.identity_element())
-        return self.group.element(TgLginv @ TeRg @ gcircleft.derepresentation)
+        # TgLginv @ TeRg, from the closed-form lifted actions
+        return self.group.element(self.group.ad_inv_matrices([self])[0] @ gcircleft.derepresentation)
 
 
 
@@ -7,7 +7,9 @@ import numpy as np
 import geomotion.representationgroup as rgp
 from vector import VectorBases
 import numdifftools as ndt
+from geomotion.utilityfunctions import LRUCache
 from lie_algebra import GroupTangentVector
+from convenience import config_key
 
 class MatrixVectorBases(VectorBases):
     def __init__(self, vectors: list, config = None, size = None) -> None:
@@ -47,12 +49,40 @@ def matrix_derivative(func, config):
     # print(f"jacobian_matrix: {jacobian_matrix} size: {size}")
     return MatrixVectorBases(vectors=jacobian_matrix, size=size)
 
+class RepresentationDerivative(object):
+    """Representation derivative at one configuration, in the forms used by velocity_rep and velocity_derep"""
+    def __init__(self, func, config) -> None:
+        bases = matrix_derivative(func, config)
+        # (n, m, m) stack of the matrix derivative along each coordinate
+        self.matrices = np.array(bases.value, dtype=float)
+        # columns of the matrix derivatives flattened in column order, and their pseudo-inverse
+        self.flattened = bases.flatten()
+        self.pinv = np.linalg.pinv(self.flattened)
+
+
 class RepresentationGroup(rgp.RepresentationGroup):
-    def __init__(self, representation_function_list, identity, derepresentation_function_list=None, specification_chart=0, normalization_function=None):
+    def __init__(self, representation_function_list, identity, derepresentation_function_list=None, specification_chart=0, normalization_function=None, cache_size=1024):
         super().__init__(representation_function_list, identity, derepresentation_function_list, specification_chart, normalization_function)
+        # representation derivatives keyed on (chart, configuration), least recently used dropped beyond cache_size
+        self.rep_derivative_cache = LRUCache(cache_size)
+
+    def representation_derivative(self, g: rgp.RepresentationGroupElement):
+        """Representation derivative at g, taken once per (chart, configuration) and then reused from the cache"""
+        value = np.asarray(g.value, dtype=float)
+        key = (g.current_chart, config_key(value))
+        if key not in self.rep_derivative_cache:
+            self.rep_derivative_cache[key] = RepresentationDerivative(self.representation_function_list[g.current_chart],
+                                                                      value)
+        return self.rep_derivative_cache[key]
+
+    def representation_derivatives(self, configs):
+        """Representation derivatives at a single configuration or a list of configurations, as a list"""
+        if isinstance(configs, (list, tuple)):
+            return [self.representation_derivative(g) for g in configs]
+        return [self.representation_derivative(configs)]
 
     def velocity_rep(self, g: rgp.RepresentationGroupElement, vector_coords: np.ndarray):
-        m = matrix_derivative(self.representation_function_list[g.current_chart], g.value).value
+        m = self.representation_derivative(g).matrices
         # print(f"m: {m} and vector_coords: {vector_coords.reshape(-1, 1)}")
         res = np.hstack([mi @ vector_coords.reshape(-1, 1) for mi in m])
         # print(f"res: {res}")
@@ -60,10 +90,28 @@ class RepresentationGroup(rgp.RepresentationGroup):
 
     def velocity_derep(self, g: rgp.RepresentationGroupElement, mat):
 
-        single_mat = matrix_derivative(self.representation_function_list[g.current_chart], g.value).flatten()
+        single_mat_pinv = self.representation_derivative(g).pinv
         velocity = np.concat([mat[:, i].ravel() for i in range(mat.shape[1])])
         # print(f"single_mat: {single_mat} inv: {np.linalg.pinv(single_mat)} and velocity: {velocity}")
-        return np.linalg.pinv(single_mat) @ velocity.reshape(-1, 1)
+        return single_mat_pinv @ velocity.reshape(-1, 1)
+
+    def velocity_rep_stack(self, configs, vector_coords: np.ndarray):
+        """Batched velocity_rep of a (K, n) stack of velocity coordinates, at a single configuration or at a list of K
+        configurations. Returns a (K, m, n) stack of velocity representations"""
+        vector_coords = np.asarray(vector_coords, dtype=float)
+        matrices = np.array([d.matrices for d in self.representation_derivatives(configs)])
+        # column i of each result is m_i @ vector_coords, as in velocity_rep
+        return np.einsum('kirc,kc->kri', np.broadcast_to(matrices, (vector_coords.shape[0],) + matrices.shape[1:]),
+                         vector_coords)
+
+    def velocity_derep_stack(self, configs, mats: np.ndarray):
+        """Batched velocity_derep of a (K, m, n) stack of velocity representations, at a single configuration or at a
+        list of K configurations. Returns a (K, n) stack of velocity coordinates"""
+        mats = np.asarray(mats, dtype=float)
+        pinvs = np.array([d.pinv for d in self.representation_derivatives(configs)])
+        # flatten each representation column by column, as in velocity_derep
+        velocities = np.swapaxes(mats, -1, -2).reshape(mats.shape[0], -1)
+        return np.einsum('kij,kj->ki', np.broadcast_to(pinvs, (mats.shape[0],) + pinvs.shape[1:]), velocities)
 
     def element(self,
                 representation,
@@ -2,6 +2,32 @@ import numpy as np
 from convenience import OpEnum, OpGen
 from group import Group, DirectProduct, SemiDirectProduct, SE2, GroupElement
 from repgroup import RepGroup, RepGroupElement
+import repgroup
+import numdifftools as nd
+import lie_algebra as la
+import rep_lie_algebra as rla
+from convenience import config_key
+import asyncio
+import json
+import os
+import tempfile
+import warnings
+from matplotlib import pyplot as plt
+from geomotion import rigidbody as rb
+from geomotion import representationliegroup as rlgp
+from geomotion import liegroup as lgp
+from geomotion import utilityfunctions as ut
+from geomotion import manifold as md
+from geomotion import diffmanifold as tb
+from Assignments import simplediffkinematicchain as dkc
+from Assignments import simplekinematicchain as skc
+from geomotion import continuumbody as cb
+
+
+def constant_curvature_shape(shape_parameters, s, t):
+    # Defined at module level so that bodies using it can be pickled to worker processes
+    return np.array([0., 0., shape_parameters[0]])
+
 
 if __name__ == '__main__':
     # test 1 affine addition
@@ -90,5 +116,483 @@ if __name__ == '__main__':
     g2 = op.element(np.array([3, 4]))
     assert np.isclose(g1.left_action(g2).value, op.element(np.array([4, 6])).value).all()
     assert np.isclose(g1.right_action(g2).value, op.element(np.array([4, 6])).value).all()
-    
-   
\ No newline at end of file
+
+    # kinematic chain used by the chain tests below
+    G = rb.SE2
+    chain = dkc.DiffKinematicChain([G.element([3, 0, 0]), G.element([2, 0, 0]), G.element([1, 0, 0])],
+                                   [G.Lie_alg_vector([0, 0, 1])] * 3)
+
+    # chain server: a ragged request only fails itself, and a malformed line is answered without dropping the
+    # connection
+    async def server_test(socket_path):
+        server = await dkc.KinematicChainServer(chain, socket_path, batch_window=0.01).start()
+        client = await dkc.KinematicChainClient(socket_path).connect()
+        good, ragged = await asyncio.gather(client.forward_kinematics([0.1, 0.2, 0.3]),
+                                            client.forward_kinematics([0.1, 0.2]), return_exceptions=True)
+        chain.set_configuration([0.1, 0.2, 0.3])
+        assert np.isclose(good, np.array([link.value for link in chain.link_positions])).all()
+        assert isinstance(ragged, Exception)
+
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        writer.write(b'{"id": 1, "type": "fk", "joint_angles": [0, 0, 0]}\nnot json\n'
+                     b'{"id": 2, "type": "fk", "joint_angles": [0, 0, 0]}\n')
+        await writer.drain()
+        responses = [json.loads(await reader.readline()) for _ in range(3)]
+        assert sorted(str(r["id"]) for r in responses if "result" in r) == ["1", "2"]
+        assert [r["id"] for r in responses if "error" in r] == [None]
+
+        # a request with an unusable type or output frame is answered with an error, and the server keeps serving
+        writer.write(b'{"id": 3, "type": ["fk"], "joint_angles": [0, 0, 0]}\n')
+        await writer.drain()
+        assert "error" in json.loads(await reader.readline())
+        writer.write(b'{"id": 4, "type": "jacobians", "output_frame": "tool", "joint_angles": [0, 0, 0]}\n'
+                     b'{"id": 5, "type": "fk", "joint_angles": [0, 0, 0]}\n')
+        await writer.drain()
+        responses = {r["id"]: r for r in [json.loads(await reader.readline()) for _ in range(2)]}
+        assert "error" in responses[4] and "result" in responses[5]
+        assert not server.batch_task.done()
+
+        # requests still waiting when the server goes away fail instead of hanging, and closing the server does not
+        # wait for its clients to disconnect first
+        server.batch_window = 5
+        pending = asyncio.create_task(client.forward_kinematics([0, 0, 0]))
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(server.close(), 2)
+        assert await reader.readline() == b""
+        writer.close()
+        try:
+            await asyncio.wait_for(pending, 2)
+            assert False
+        except asyncio.TimeoutError:
+            assert False
+        except Exception:
+            pass
+        await client.close()
+
+    with tempfile.TemporaryDirectory() as socket_dir:
+        asyncio.run(server_test(os.path.join(socket_dir, "chain.sock")))
+
+    # SE2 logarithm: exp(log(g)) recovers g, including rotations near and at pi
+    theta = np.array([0., 1e-9, 1e-5, 0.3, -2., np.pi - 1e-6, np.pi, -np.pi])
+    g_reps = G.representation_grid(np.stack([np.linspace(-1, 1, 8), np.linspace(2, -1, 8), theta], -1))
+    assert np.isclose(ut.stacked_expm(G.log_rep_grid(g_reps)), g_reps, atol=1e-12).all()
+    # the general matrix logarithm agrees away from pi, and refuses rotations by pi instead of diverging
+    assert np.isclose(ut.stacked_logm(g_reps[:5]), G.log_rep_grid(g_reps[:5]), atol=1e-12).all()
+    try:
+        ut.stacked_logm(g_reps[6:7])
+        assert False
+    except AssertionError:
+        raise
+    except Exception:
+        pass
+
+    # inverse kinematics reaches reachable targets, with joint angles wrapped into (-pi, pi]
+    # (started a few turns away from the solutions, so that the unwrapped angles would be far outside (-pi, pi])
+    solutions = np.array([[0.4, 1., -0.5], [2.5, -2., 3.], [-1.5, 0.2, -2.9]])
+    targets = chain.set_configurations(solutions)[:, -1]
+    initial_joint_angles = solutions + 2 * np.pi * np.array([2., -3., 4.]) + 0.1
+    joint_angles, error_norm, converged = chain.inverse_kinematics(targets, initial_joint_angles)
+    assert converged.all()
+    assert ((joint_angles > -np.pi) & (joint_angles <= np.pi)).all()
+    link_positions = chain.set_configurations(joint_angles)
+    assert np.isclose(G.representation_grid(link_positions[:, -1]), G.representation_grid(targets)).all()
+
+    # unreachable targets stop with a finite, unconverged answer and without numerical warnings, once the damping
+    # reaches its cap
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        joint_angles, error_norm, converged = chain.inverse_kinematics(np.array([[10., 0., 0.], [0., 20., 1.]]),
+                                                                       [0.3, 0.2, 0.1], max_iterations=1000)
+    assert np.isfinite(joint_angles).all() and np.isfinite(error_norm).all() and not converged.any()
+    assert np.isclose(error_norm[0], 4.)
+
+    # joint limits: a target reachable within the limits is reached without leaving them, and a target that needs
+    # a joint outside its limits is not reached
+    joint_limits = np.array([[-0.5, 0.5]] * 3)
+    limited_targets = chain.set_configurations(np.array([[0.2, -0.3, 0.4], [1.5, 0., 0.]]))[:, -1]
+    joint_angles, error_norm, converged = chain.inverse_kinematics(limited_targets, [0., 0., 0.],
+                                                                   joint_limits=joint_limits)
+    assert converged.tolist() == [True, False]
+    assert ((joint_angles >= -0.5) & (joint_angles <= 0.5)).all()
+    assert np.isclose(G.representation_grid(chain.set_configurations(joint_angles[:1])[:, -1]),
+                      G.representation_grid(limited_targets[:1])).all()
+
+    # differential maps: the 'jacobian' and 'jvp' methods agree, and match the chain rule through the output chart
+    # transition, when the output chart differs from the output defining chart
+    def cartesian_to_polar(q):
+        return np.array([np.sqrt(q[0] ** 2 + q[1] ** 2), np.arctan2(q[1], q[0])])
+
+    def polar_to_cartesian(q):
+        return np.array([q[0] * np.cos(q[1]), q[0] * np.sin(q[1])])
+
+    def polar_Jacobian(q):
+        r = np.sqrt(q[0] ** 2 + q[1] ** 2)
+        return np.array([[q[0] / r, q[1] / r], [-q[1] / r ** 2, q[0] / r ** 2]])
+
+    def fmap(q):
+        return np.array([q[0] + 0.3 * q[1] ** 2, np.sin(q[0]) + q[1]])
+
+    def fmap_Jacobian(q):
+        return np.array([[1., 0.6 * q[1]], [np.cos(q[0]), 1.]])
+
+    R2 = tb.DiffManifold([[None, cartesian_to_polar], [polar_to_cartesian, None]], 2)
+    f = md.ManifoldMap(R2, R2, [fmap, None], [0, 0], [1, 1])
+    q = R2.element([0.7, 0.4], 0)
+    v = tb.TangentVector(R2, q, [1., 0.5])
+    v_expected = polar_Jacobian(fmap(q.value)) @ fmap_Jacobian(q.value) @ v.value
+    for method in ['jacobian', 'jvp']:
+        v_out = tb.DifferentialMap(f, method)(v)
+        assert v_out.configuration.current_chart == 1
+        assert np.isclose(v_out.configuration.value, cartesian_to_polar(fmap(q.value))).all()
+        assert np.isclose(v_out.value, v_expected).all()
+
+    # changing the output chart keeps an analytic Jacobian, and the Jacobian cache is bounded
+    f = md.ManifoldMap(R2, R2, [fmap, None], jacobian_function_list=[fmap_Jacobian, None], jacobian_cache_size=3)
+    f_polar = f.transition_output(1)
+    assert f_polar.jacobian_function_list is f.jacobian_function_list
+    assert np.isclose(f_polar.jacobian(q), fmap_Jacobian(q.value)).all()
+    for x in np.linspace(0, 1, 10):
+        f.jacobian(R2.element([x, 0.2], 0))
+    assert len(f.jacobian_cache) == 3
+
+    # without an analytic Jacobian, maps and variational integration share one numerical differentiation default
+    f_numeric = md.ManifoldMap(R2, R2, [fmap, None])
+    assert f_numeric.jacobian_method == md.default_jacobian_method
+    assert np.isclose(f_numeric.jacobian(q), fmap_Jacobian(q.value), atol=1e-8).all()
+
+    # lifted action matrices: the representation formula matches numerical differentiation of the group action, and
+    # the bounded cache belongs to a single group
+    g = G.element([1., 2., 0.7])
+    h = G.element([-0.5, 0.3, 2.])
+    assert np.isclose(G.TL_matrix(g, h), G.lifted_action_matrix(g, h, 'left')).all()
+    assert np.isclose(G.TR_matrix(h, g), G.lifted_action_matrix(h, g, 'right')).all()
+    G.set_lifted_action_cache(5)
+    configurations = G.element_set(ut.meshgrid_array(np.linspace(-1, 1, 3), np.linspace(-1, 1, 4), [0., 1.]))
+    TL = G.TL_matrix(configurations, h)
+    assert len(G.lifted_action_cache) == 5
+    assert np.isclose(G.TL_matrix(configurations, h), TL).all()
+    assert np.isclose(TL[1, 2, 0], G.lifted_action_matrix(configurations[1][2][0], h, 'left')).all()
+    G_copy = rlgp.RepresentationLieGroup(rb.SE2_rep, [0, 0, 0], rb.SE2_derep, 0, rb.SE2_normalize, vectorized=True)
+    assert G_copy.lifted_action_cache is None
+    G.set_lifted_action_cache(None)
+
+    # matrix-group lifted actions: closed-form matrices match numerical derivatives of the group action, and the
+    # representation derivatives are cached under the shared configuration key
+    se2_lie = la.LieGroup(repgroup.SE2.se2_repr, repgroup.SE2.se2_derepr, np.eye(3), cache_size=16)
+    g = se2_lie.element(np.array([1., 2., 0.3]))
+    h = se2_lie.element(np.array([-1., 0.5, 2.]))
+    TL_numeric = nd.Jacobian(lambda x: repgroup.SE2.se2_derepr(g.value @ repgroup.SE2.se2_repr(x)))(h.derepresentation)
+    TR_numeric = nd.Jacobian(lambda x: repgroup.SE2.se2_derepr(repgroup.SE2.se2_repr(x) @ h.value))(g.derepresentation)
+    assert np.isclose(se2_lie.left_lifted_action(g, h), TL_numeric).all()
+    assert np.isclose(se2_lie.right_lifted_action(h, g), TR_numeric).all()
+    assert np.isclose(se2_lie.ad_inv_matrices([g, h]) @ se2_lie.ad_matrices([g, h]), np.eye(3)).all()
+    assert config_key(g.value @ g.inverted_element.value) == config_key(np.eye(3))
+    assert len(se2_lie.rep_derivative_cache) <= 16
+
+    # batched lifted-action bases match the per-configuration list form
+    sdp = repgroup.SemiDirectProduct()
+    sdp_configs = [RepGroupElement(value=np.array([a, b]), group=sdp) for a in [0.5, 2.] for b in [-1., 1.]]
+    direction = RepGroupElement(value=np.array([1., 0.]), group=sdp)
+    bases = la.GroupVectorBases(sdp_configs).evaluate(direction, "left", in_vb_form=False)
+    assert bases.shape == (4, 2, 2)
+    basis_list = la.derivative_group_action_bases(direction, sdp_configs[3])
+    assert np.isclose(bases[3], [gtv.flatten().ravel() for gtv in basis_list]).all()
+
+    # represented velocities: batched rep/derep match the single-vector forms, and derep inverts rep
+    se2_rep = rla.SE2.element(np.array([1., 1., np.pi / 4]))
+    velocities = np.array([[1., -1., 0.], [0.5, 0.2, 1.], [0., 0., -2.]])
+    velocity_reps = rla.SE2.velocity_rep_stack(se2_rep, velocities)
+    assert np.isclose(velocity_reps[1], rla.SE2.velocity_rep(se2_rep, velocities[1])).all()
+    assert np.isclose(rla.SE2.velocity_derep_stack(se2_rep, velocity_reps)[2],
+                      rla.SE2.velocity_derep(se2_rep, velocity_reps[2]).ravel()).all()
+
+    # workspace reducers: link numbers start at 1 (or count back from -1), and other numbers are rejected
+    last_link, first_link, box = chain.reduce_workspace([skc.ReachRadius(), skc.ReachRadius(1), skc.BoundingBox(3)],
+                                                        n_samples=500, chunk_size=128, rng=0)
+    assert np.isclose(first_link.min_radius, 3.) and np.isclose(first_link.max_radius, 3.)
+    assert last_link.max_radius <= 6. and (box.upper[:2] <= 6.).all() and (box.lower[:2] >= -6.).all()
+    for bad_link_index in [0, 4, -4]:
+        try:
+            chain.reduce_workspace([skc.ReachRadius(bad_link_index)], n_samples=10)
+            assert False
+        except IndexError:
+            pass
+
+    # manipulability map: a planar two-link chain cannot move in every SE(2) direction, so it has zero manipulability
+    # and infinite condition number everywhere, and worker processes reproduce the serial sweep
+    two_link_chain = dkc.DiffKinematicChain([G.element([1, 0, 0])] * 2, [G.Lie_alg_vector([0, 0, 1])] * 2)
+    two_link_grid = ut.meshgrid_array(np.linspace(-1, 1, 5), np.linspace(-1, 1, 4))
+    manipulability, condition_number, _ = two_link_chain.manipulability_map(two_link_grid, chunk_size=3)
+    assert (manipulability == 0).all() and np.isinf(condition_number).all()
+    manipulability_parallel, condition_number_parallel, _ = two_link_chain.manipulability_map(
+        two_link_grid, chunk_size=3, n_processes=2)
+    assert np.array_equal(manipulability, manipulability_parallel)
+    assert np.array_equal(condition_number, condition_number_parallel)
+
+    # on a full-rank link, manipulability and condition number both come from the body Jacobian's singular values
+    q = np.array([0.3, -0.7, 1.1])
+    single_configuration = ut.meshgrid_array(*[q[i:i + 1] for i in range(3)])
+    manipulability, condition_number, _ = chain.manipulability_map(single_configuration)
+    chain.set_configuration(q)
+    J = chain.Jacobian_Ad_inv(3, 'body')
+    assert np.isclose(manipulability.ravel()[0], np.sqrt(np.linalg.det(J @ J.T)))
+    assert np.isclose(condition_number.ravel()[0], np.linalg.cond(J))
+
+    # backbone sweep: constant-curvature backbones follow circular arcs, and worker processes reproduce the serial
+    # sweep
+    arc_body = cb.ContinuumBody(constant_curvature_shape)
+    curvatures = np.array([[0.5], [1.], [2.], [-1.5], [3.]])
+    arclengths = np.array([0.25, 0.5, 1.])
+    arc_poses = arc_body.backbone_sweep(curvatures, arclengths, chunk_size=2)
+    turning = curvatures * arclengths
+    assert np.isclose(arc_poses, np.stack([np.sin(turning) / curvatures, (1 - np.cos(turning)) / curvatures, turning],
+                                          axis=-1)).all()
+    assert np.array_equal(arc_poses, arc_body.backbone_sweep(curvatures, arclengths, chunk_size=2, n_processes=2))
+
+    # variational integration: the flow Jacobians with respect to the initial configuration and the parameters match
+    # finite differences of the flow, both with the default central differences and with an analytic field Jacobian
+    def pendulum(q, t, p):
+        return np.array([q[1], -p[0] * np.sin(q[0])])
+
+    def pendulum_Jacobian(t, q, p):
+        return np.array([[0., 1., 0.], [-p[0] * np.cos(q[0]), 0., -np.sin(q[0])]])
+
+    R2_flat = tb.DiffManifold([[None]], 2)
+    pendulum_field = tb.TangentVectorField(R2_flat, pendulum)
+    q0 = np.array([1., -0.3])
+    p = np.array([2.])
+
+    def pendulum_flow(q0_value, p_value):
+        return pendulum_field.integrate([0, 1.5], R2_flat.element(q0_value, 0), 'final', 'array', parameters=p_value,
+                                        rtol=1e-10, atol=1e-12)
+
+    dq_dq0_fd = md.central_difference_jacobian(lambda x: pendulum_flow(x, p), q0)
+    dq_dp_fd = md.central_difference_jacobian(lambda x: pendulum_flow(q0, x), p)
+    for field_Jacobian in [None, pendulum_Jacobian]:
+        q_final, dq_dq0, dq_dp = pendulum_field.integrate([0, 1.5], R2_flat.element(q0, 0), 'final', 'array',
+                                                          variational=True, parameters=p,
+                                                          jacobian_function=field_Jacobian, rtol=1e-10, atol=1e-12)
+        assert np.isclose(q_final, pendulum_flow(q0, p)).all()
+        assert np.isclose(dq_dq0, dq_dq0_fd, atol=1e-6).all()
+        assert np.isclose(dq_dp, dq_dp_fd, atol=1e-6).all()
+
+    # batched forward kinematics: each row of set_configurations matches set_configuration at those joint angles
+    joint_angle_array = np.array([[0.3, -0.7, 1.1], [2.5, 0.4, -3.], [0., 0., 0.]])
+    link_position_array, link_position_rep_array = chain.set_configurations(joint_angle_array, output_reps=True)
+    assert link_position_array.shape == (3, 3, 3)
+    for joint_angles, link_position_values, link_position_reps in zip(joint_angle_array, link_position_array,
+                                                                       link_position_rep_array):
+        chain.set_configuration(joint_angles)
+        assert np.isclose(link_position_values, [l.value for l in chain.link_positions]).all()
+        assert np.isclose(link_position_reps, [l.rep for l in chain.link_positions]).all()
+
+    # all-links Jacobians: the current-configuration and batched tensors match the per-link Adjoint-inverse Jacobian
+    for output_frame in ["body", "spatial", "world"]:
+        J_batch = chain.Jacobians_batch(joint_angle_array, output_frame)
+        for joint_angles, J_links in zip(joint_angle_array, J_batch):
+            chain.set_configuration(joint_angles)
+            J_current = chain.Jacobians(output_frame)
+            for link_index in range(1, 4):
+                assert np.isclose(J_links[link_index - 1], chain.Jacobian_Ad_inv(link_index, output_frame)).all()
+                assert np.isclose(J_current[link_index - 1], J_links[link_index - 1]).all()
+
+    # incremental forward kinematics: changing joints one at a time gives the same link positions as a fresh
+    # evaluation, and leaves the links before the changed joint untouched
+    chain.set_configuration([0.3, -0.7, 1.1])
+    first_link_position = chain.link_positions[0]
+    chain.set_joint(2, -0.4)
+    assert chain.link_positions[0] is first_link_position
+    chain.set_joint(1, 0.9)
+    chain.set_joints([0, 2], [-1.2, 2.])
+    incremental_values = [l.value for l in chain.link_positions]
+    fresh_chain = dkc.DiffKinematicChain(chain.links, chain.joint_axes)
+    fresh_chain.set_configuration([-1.2, 0.9, 2.])
+    assert np.isclose(incremental_values, [l.value for l in fresh_chain.link_positions]).all()
+
+    # link velocities: recursive velocity propagation matches each link's Jacobian applied to the joint velocities
+    joint_velocity_array = np.array([[1., 0., -0.5], [0.2, -1.3, 0.7], [0., 2., 1.]])
+    for output_frame in ["body", "spatial", "world"]:
+        link_velocity_array = chain.link_velocities(joint_angle_array, joint_velocity_array, output_frame)
+        J_batch = chain.Jacobians_batch(joint_angle_array, output_frame)
+        assert np.isclose(link_velocity_array, np.matmul(J_batch, joint_velocity_array[:, None, :, None])[..., 0]).all()
+
+    # tip sensitivity: the one-pass shape Jacobian matches finite differences of the tip pose, and the frames are
+    # related by the Adjoint of the tip
+    def linear_curvature_shape(shape_parameters, s, t):
+        return np.array([0., 0., shape_parameters[0] + shape_parameters[1] * s])
+
+    def tip_pose(shape_parameters):
+        return sensitivity_body.backbone_poses(shape_parameters, [1.])[-1]
+
+    sensitivity_body = cb.ContinuumBody(linear_curvature_shape)
+    shape_parameters = np.array([0.8, -1.5])
+    tip_value, J_world = sensitivity_body.tip_sensitivity(shape_parameters, output_frame="world")
+    assert np.isclose(tip_value, tip_pose(shape_parameters)).all()
+    assert np.isclose(J_world, md.central_difference_jacobian(tip_pose, shape_parameters), atol=1e-6).all()
+    _, J_body = sensitivity_body.tip_sensitivity(shape_parameters, output_frame="body")
+    _, J_spatial = sensitivity_body.tip_sensitivity(shape_parameters, output_frame="spatial")
+    tip = G.element(tip_value)
+    for J_body_column, J_spatial_column in zip(J_body.T, J_spatial.T):
+        assert np.isclose(np.ravel(tip.Ad(G.Lie_alg_vector(J_body_column)).value), J_spatial_column).all()
+
+    # points acted on directly by SE(2) elements land where the lifted points would, for single elements and for
+    # arrays of element representations
+    acting_elements = [G.element([1., -2., 0.4]), G.element([0., 3., -2.5])]
+    points = np.array([[0.5, 1.], [-2., 0.3], [0., 0.]])
+    lifted_points = [[(g_i * G.element([x, y, 0.])).value[:2] for x, y in points] for g_i in acting_elements]
+    assert np.isclose(G.act_on_points(acting_elements[0], points), lifted_points[0]).all()
+    assert np.isclose(G.act_on_points(np.array([g_i.rep for g_i in acting_elements]), points), lifted_points).all()
+
+    # closed-form generator fields of a representation group match the numerically differentiated generator fields
+    h_delta = np.array([0.5, -1., 0.8])
+    for g_value in [[1., 2., 0.3], [-1., 0.5, 2.5]]:
+        g = G.element(g_value)
+        assert np.isclose(np.ravel(G.L_generator(h_delta)(g).value),
+                          np.ravel(lgp.LieGroup.L_generator(G, h_delta)(g).value), atol=1e-8).all()
+        assert np.isclose(np.ravel(G.R_generator(h_delta)(g).value),
+                          np.ravel(lgp.LieGroup.R_generator(G, h_delta)(g).value), atol=1e-8).all()
+
+    # scene graph: world poses are the products of the relative poses down the tree, and moving a parent marks its
+    # subtree dirty and moves the descendants (and their bodies) with it
+    root = rb.SceneNode([1., 0., 0.5])
+    child = rb.SceneNode([2., 0., 0.3], parent=root)
+    grandchild = rb.SceneNode([0., 1., -1.], body=rb.RigidBody(None), parent=child)
+    sibling = rb.SceneNode([0., 2., 0.], parent=root)
+    scene_graph = rb.SceneGraph(root)
+    assert scene_graph.nodes == [root, child, sibling, grandchild]
+
+    def composed(*values):
+        product = G.identity_element()
+        for value in values:
+            product = product * G.element(value)
+        return product.value
+
+    assert np.isclose(scene_graph.world_positions(),
+                      [composed([1., 0., 0.5]), composed([1., 0., 0.5], [2., 0., 0.3]),
+                       composed([1., 0., 0.5], [0., 2., 0.]),
+                       composed([1., 0., 0.5], [2., 0., 0.3], [0., 1., -1.])]).all()
+    assert not any(node.dirty for node in scene_graph.nodes)
+
+    root.relative_position = G.element([-1., 3., 2.])
+    assert all(node.dirty for node in scene_graph.nodes)
+    assert np.isclose(grandchild.world_position.value, composed([-1., 3., 2.], [2., 0., 0.3], [0., 1., -1.])).all()
+    assert not grandchild.dirty and sibling.dirty
+    scene_graph.update()
+    assert np.isclose(sibling.world_position.value, composed([-1., 3., 2.], [0., 2., 0.])).all()
+    assert np.isclose(grandchild.body.position.value, grandchild.world_position.value).all()
+
+    # vectorized SE(2) representation: a stack of values maps to the matching stack of matrices and back, and the
+    # closed-form logarithm inverts the exponential on the whole stack
+    value_stack = np.stack(np.meshgrid(np.linspace(-2., 2., 3), np.linspace(-1., 1., 2), np.linspace(-3., 3., 4),
+                                       indexing='ij'), -1)
+    rep_stack = rb.SE2_rep(value_stack)
+    assert rep_stack.shape == value_stack.shape[:-1] + (3, 3)
+    assert np.isclose(rep_stack[1, 0, 2], G.element(value_stack[1, 0, 2]).rep).all()
+    assert np.isclose(rb.SE2_derep(rep_stack), value_stack).all()
+    assert np.isclose(ut.stacked_expm(np.reshape(rb.SE2_log_rep(rep_stack), (-1, 3, 3))),
+                      np.reshape(rep_stack, (-1, 3, 3))).all()
+
+    # body drawing points: the local geometry is evaluated once, and the pose (or a stack of poses) acts on it
+    triangle = rb.cornered_triangle(G.element([1., -2., 0.7]), 0.5, 'red')
+    locus_calls = []
+    triangle.plot_info.plot_locus = [lambda body, p=p: locus_calls.append(p) or p(body)
+                                     for p in triangle.plot_info.plot_locus]
+    triangle.clear_plot_cache()
+    world_points = triangle.plot_points()
+    triangle.plot_points()
+    assert len(locus_calls) == 2
+    corners = triangle.plot_info.plot_locus[0](triangle)
+    lifted_corners = [(triangle.position * G.element([x, y, 0.])).value[:2] for x, y in corners]
+    assert np.isclose(world_points[0].T, lifted_corners).all()
+    stacked_points = triangle.plot_points(rb.SE2_rep(np.array([[0., 0., 0.], [1., -2., 0.7]])))
+    assert stacked_points[0].shape == (2, 2, 3)
+    assert np.isclose(stacked_points[0][1], world_points[0]).all() and np.isclose(stacked_points[0][0], corners.T).all()
+
+    # animations: rendering to a file steps the artists through every frame, leaving them at the last pose
+    with tempfile.TemporaryDirectory() as animation_dir:
+        fig, ax = plt.subplots()
+        body_trajectory = np.array([[0., 0., 0.], [1., 0.5, 0.3], [2., -1., 1.2]])
+        triangle.animate(ax, body_trajectory, filename=os.path.join(animation_dir, "body.gif"))
+        final_points = triangle.plot_points(rb.SE2_rep(body_trajectory[-1]))
+        assert np.isclose(ax.patches[0].get_xy()[:3], final_points[0].T).all()
+        plt.close(fig)
+
+        fig, ax = plt.subplots()
+        joint_trajectory = np.array([[0., 0., 0.], [0.5, -0.5, 1.], [1., 0.3, -2.]])
+        chain.animate(ax, joint_trajectory, filename=os.path.join(animation_dir, "chain.gif"))
+        final_link_positions = chain.set_configurations(joint_trajectory[-1:])[0]
+        assert np.isclose(np.transpose(ax.lines[0].get_data())[1:], final_link_positions[:, :2]).all()
+        plt.close(fig)
+
+    # workspace sampling: lattice samples arrive in bounded chunks that cover the lattice once, and the streaming
+    # reducers agree with reductions over all of the samples at once
+    chunks = list(chain.workspace_samples(lattice_shape=(4, 3, 5), chunk_size=7))
+    assert max(len(joint_angle_chunk) for joint_angle_chunk, _ in chunks) == 7
+    all_joint_angles = np.concatenate([joint_angle_chunk for joint_angle_chunk, _ in chunks])
+    all_link_positions = np.concatenate([link_position_chunk for _, link_position_chunk in chunks])
+    assert len(np.unique(all_joint_angles, axis=0)) == 60
+    assert np.isclose(all_link_positions, chain.set_configurations(all_joint_angles)).all()
+    box, histogram = chain.reduce_workspace([skc.BoundingBox(), skc.OccupancyHistogram(((-6., 6.), (-6., 6.)))],
+                                            lattice_shape=(4, 3, 5), chunk_size=7)
+    assert np.isclose(box.lower, all_link_positions[:, -1].min(axis=0)).all()
+    assert np.isclose(box.upper, all_link_positions[:, -1].max(axis=0)).all()
+    assert histogram.counts.sum() + histogram.n_outside == 60
+    random_chunks = list(chain.workspace_samples(n_samples=25, chunk_size=10, rng=1))
+    assert [len(joint_angle_chunk) for joint_angle_chunk, _ in random_chunks] == [10, 10, 5]
+    assert np.array_equal(random_chunks[0][0], next(chain.workspace_samples(n_samples=25, chunk_size=10, rng=1))[0])
+
+    # continuum body outline: the sides are the backbone poses offset by half the width along their local y axes,
+    # and the cached backbone samples are refreshed when the configuration changes
+    arc_body.set_configuration([2.])
+    outline = arc_body.outline(5)
+    s_outline = np.linspace(0., 1., 5)
+    backbone = [G.element([np.sin(2. * s) / 2., (1 - np.cos(2. * s)) / 2., 2. * s]) for s in s_outline]
+    top_side = [(g_s * G.element([0., arc_body.width / 2, 0.])).value[:2] for g_s in backbone]
+    bottom_side = [(g_s * G.element([0., -arc_body.width / 2, 0.])).value[:2] for g_s in backbone]
+    assert outline.shape == (2, 10)
+    assert np.isclose(outline.T, top_side + bottom_side[::-1], atol=1e-8).all()
+    arc_body.set_configuration([-1.])
+    assert np.isclose(arc_body.outline(5)[:, 4], [np.sin(-1.) / -1., (1 - np.cos(-1.)) / -1.]
+                      + arc_body.width / 2 * np.array([-np.sin(-1.), np.cos(-1.)]), atol=1e-8).all()
+    fig, ax = plt.subplots()
+    arc_body.draw(ax, n_outline=5, n_spots=4)
+    assert np.isclose(ax.patches[0].get_xy()[:10], arc_body.outline(5).T).all()
+    assert len(ax.collections[0].get_offsets()) == 4
+    plt.close(fig)
+
+    # rigid body scene: loci that share a plot function and style are drawn as one collection, whose polygons are
+    # the bodies' drawing points, and updating the scene moves the polygons with the bodies
+    scene_bodies = [rb.cornered_triangle(G.element([0., 0., 0.]), 0.5, 'red'),
+                    rb.cornered_triangle(G.element([2., 1., 1.]), 0.5, 'red')]
+    scene = rb.RigidBodyScene(scene_bodies)
+    fig, ax = plt.subplots()
+    collections = scene.draw(ax)
+    assert len(collections) == 2
+
+    def check_scene_polygons():
+        for locus_index, collection in enumerate(collections):
+            for body, path in zip(scene_bodies, collection.get_paths()):
+                assert np.isclose(path.vertices[:3], body.plot_points()[locus_index].T).all()
+
+    check_scene_polygons()
+    scene_bodies[1].position = G.element([-1., 3., -2.])
+    scene.update()
+    check_scene_polygons()
+    plt.close(fig)
+
+    # Lie group lifted actions: elements differentiate the group action with the full Jacobian unless the group
+    # opts in to Jacobian-vector products, and both match the exact derivative of a nonlinear action
+    def cube_action(g, h):
+        return np.array([np.cbrt(g[0] ** 3 + h[0] ** 3), g[1] + h[1]])
+
+    def cube_inverse(g):
+        return -np.asarray(g)
+
+    assert lgp.LieGroup(cube_action, [0., 0.], cube_inverse).element([1., 0.]).TL.method == 'jacobian'
+    cube_derivative = 0.8 ** 2 / np.cbrt(1.3 ** 3 + 0.8 ** 3) ** 2
+    for lifted_action_method in ['jacobian', 'jvp']:
+        cube_group = lgp.LieGroup(cube_action, [0., 0.], cube_inverse, lifted_action_method=lifted_action_method)
+        g = cube_group.element([1.3, 0.2])
+        v = cube_group.vector(cube_group.element([0.8, -1.]), [1., 0.5])
+        assert np.isclose(np.ravel((g * v).value), [cube_derivative, 0.5], atol=1e-8).all()
+        assert np.isclose(np.ravel((v * g).value), [cube_derivative, 0.5], atol=1e-8).all()